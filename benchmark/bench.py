@@ -0,0 +1,221 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import argparse
+import csv
+import gc
+import json
+import platform
+import re
+import tempfile
+import time
+import tracemalloc
+
+from fields_packer import Field, Block
+from fields_packer import ParserWithNameDict, CsvBulkParser
+from fields_packer import CGeneratorBase, CUnionBase, Validator
+
+import synth
+
+"""
+Benchmarks of parse, validate, sort and generate on synthetic register maps.
+
+Usage:
+    python3 bench.py --blocks 20000 --fields 8 --shape tuple -o base.json
+    python3 bench.py --blocks 20000 --fields 8 --shape tuple --baseline base.json
+
+Every phase is timed without tracemalloc, then run again with tracemalloc
+for the peak memory. With --baseline, phases slower than the baseline by
+more than --tolerance are reported and the exit code is 1.
+"""
+
+
+def addr_parser(block):
+    if isinstance(block._addr, tuple):
+        dev, addr = block._addr
+        return "Dev{dev:d}, Addr({addr:04x})".format(dev = dev, addr = addr)
+    return "0x{:04x}".format(block._addr)
+
+
+class CsvRowParser(ParserWithNameDict):
+    """
+    The csv.reader parser used by the demos, as the reference.
+    """
+    def __init__(self, csv_file):
+        super().__init__(
+            "CsvRow",
+            bcreator = Block.BlockCreator(addr_parser = addr_parser))
+        self._csv = csv_file
+
+    def extract_addr(self, s):
+        res = [int(x, 16) for x in re.findall("0[xX][0-9a-f,A-F]+", s)]
+        return res[0] if len(res) == 1 else tuple(res)
+
+    def _parser(self):
+        with open(self._csv, "r") as csvfile:
+            addr = None
+            for row in csv.reader(csvfile):
+                if len(row) == row.count("") or row[0].startswith("#"):
+                    continue
+                if re.match("^# addr=.*$", row[1]):
+                    addr = self.extract_addr(row[1])
+                    self._register_block_name(addr, row[2])
+                elif re.match(r"\[.*\]$", row[1]):
+                    bits, shift = Field.extract_range(row[1])
+                    self._add_field(Field.new_field(
+                        name = row[2], addr = addr, bits = bits, shift = shift,
+                        source = str(row)))
+
+
+def bulk_parse(path):
+    return CsvBulkParser(
+        path, bcreator = Block.BlockCreator(addr_parser = addr_parser)
+    ).gen_group()
+
+
+def count_fields(group):
+    return sum(len(b._fields) for b in group._blocks)
+
+
+"""
+Phases: name -> (setup(path) -> state, run(state) -> number of items, unit)
+"""
+def _phases():
+    def parse_row(path):
+        return count_fields(CsvRowParser(path).gen_group())
+
+    def parse_bulk(path):
+        return count_fields(bulk_parse(path))
+
+    def validate(group):
+        Validator(group).run()
+        return count_fields(group)
+
+    def sort(group):
+        blocks = group.dump()
+        for b in blocks:
+            b.dump()
+        return len(blocks)
+
+    def resort(group):
+        return sort(group)
+
+    def sorted_group(path):
+        group = bulk_parse(path)
+        sort(group)
+        return group
+
+    def generate(group):
+        return len(CGeneratorBase(group, CUnionBase).generate())
+
+    return (
+        ("parse_csv_reader", lambda p: p, parse_row, "fields"),
+        ("parse_bulk", lambda p: p, parse_bulk, "fields"),
+        ("validate", bulk_parse, validate, "fields"),
+        ("sort", bulk_parse, sort, "blocks"),
+        ("sort_cached", sorted_group, resort, "blocks"),
+        ("generate", sorted_group, generate, "chars"),
+    )
+
+
+def measure(setup, run, path, memory):
+    state = setup(path)
+    gc.collect()
+    start = time.perf_counter()
+    items = run(state)
+    seconds = time.perf_counter() - start
+    del state
+
+    peak = None
+    if memory:
+        state = setup(path)
+        gc.collect()
+        tracemalloc.start()
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return dict(
+        seconds = seconds,
+        items = items,
+        items_per_sec = items / seconds if seconds else None,
+        peak_bytes = peak,
+    )
+
+
+def compare(results, baseline, tolerance):
+    """
+    @output list of regression messages
+    """
+    regressions = list()
+    for name, res in results["phases"].items():
+        base = baseline.get("phases", {}).get(name, None)
+        if not base or not base.get("items_per_sec") or not res["items_per_sec"]:
+            continue
+        ratio = res["items_per_sec"] / base["items_per_sec"]
+        if ratio < 1 - tolerance:
+            regressions.append("{}: {:.0f} {}/s, baseline {:.0f} ({:.0%})".format(
+                name, res["items_per_sec"], res["unit"],
+                base["items_per_sec"], ratio))
+    return regressions
+
+
+def main(argv = None):
+    ap = argparse.ArgumentParser(description = "fields_packer benchmarks")
+    ap.add_argument("--blocks", type = int, default = 10000)
+    ap.add_argument("--fields", type = int, default = 8,
+        help = "fields per block")
+    ap.add_argument("--shape", choices = synth.SHAPES, default = "int")
+    ap.add_argument("--density", type = float, default = 1.0,
+        help = "ratio of register bits covered by fields")
+    ap.add_argument("--phase", action = "append",
+        help = "run only these phases")
+    ap.add_argument("--no-memory", action = "store_true",
+        help = "skip the tracemalloc run")
+    ap.add_argument("-o", "--output", help = "write results as json")
+    ap.add_argument("--baseline", help = "compare with a json baseline")
+    ap.add_argument("--tolerance", type = float, default = 0.2)
+    args = ap.parse_args(argv)
+
+    results = dict(
+        config = dict(
+            blocks = args.blocks, fields = args.fields,
+            shape = args.shape, density = args.density),
+        python = platform.python_version(),
+        phases = dict(),
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "map.csv")
+        rows = synth.write_csv(
+            path, args.blocks, args.fields, args.shape, args.density)
+        results["config"]["rows"] = rows
+
+        for name, setup, run, unit in _phases():
+            if args.phase and name not in args.phase:
+                continue
+            res = measure(setup, run, path, not args.no_memory)
+            res["unit"] = unit
+            results["phases"][name] = res
+
+            peak = res["peak_bytes"]
+            print("{:<18} {:8.3f}s {:>12.0f} {}/s  peak {}".format(
+                name, res["seconds"], res["items_per_sec"] or 0, unit,
+                "-" if peak is None else "{:.1f}MB".format(peak / 1e6)))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print("REGRESSION " + r)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import timeit
+
+from fields_packer import CUnionBase, compile_template
+
+"""
+Compare str.format() with compiled templates.
+
+Usage: python3 bench_template.py [number]
+"""
+
+TEMPLETE_GETTER = (
+"""
+static inline uint32_t get_{field}(void)
+{{
+	{uname} reg = ({uname})reg_read({addr});
+	return reg.{field};
+}}
+""")
+
+CASES = (
+    ("attribute", CUnionBase.TEMPLETE_ATTRITUBE, dict(
+        c_type = "uint32_t", name = "dev0_clk_en", bits = 1, comment = "[2]")),
+    ("typedef", CUnionBase.TEMPLETE_TYPEDEF, dict(
+        raw_name = "union r_DEV0", struct = "\tstruct {};", name = "R_DEV0")),
+    ("getter", TEMPLETE_GETTER, dict(
+        field = "dev0_clk_en", uname = "R_DEV0", addr = "0x1002")),
+)
+
+
+def bench(number):
+    for name, template, kw in CASES:
+        render = compile_template(template)
+        assert render(**kw) == template.format(**kw)
+
+        fmt = timeit.timeit(lambda: template.format(**kw), number = number)
+        compiled = timeit.timeit(lambda: render(**kw), number = number)
+        print("{:<10} format: {:.3f}s  compiled: {:.3f}s  speedup: {:.2f}x".format(
+            name, fmt, compiled, fmt / compiled))
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,81 @@
+import random
+
+"""
+Synthetic register maps for benchmarks.
+
+The csv files have the same format as the demos:
+
+    ,# addr=0x1000, BLOCK_1000
+    ,[3:0],block_1000_f0
+
+Address shapes:
+- "int":   addr=0x1000
+- "tuple": addr=(0x01 0x1000), like the peripheral demo.
+"""
+
+SHAPES = ("int", "tuple")
+
+# bits of a register, the same as CUnionBase
+REG_BITS = 16
+
+
+def layout(fields, density):
+    """
+    Return (bits, shift) of `fields` fields which cover about `density` of
+    a register.
+    """
+    if not 0 < fields <= REG_BITS:
+        raise ValueError("fields must be in [1, {}]".format(REG_BITS))
+
+    bits = max(1, int(REG_BITS * density) // fields)
+    stride = REG_BITS // fields
+    return [(bits, i * stride) for i in range(fields)]
+
+
+def addresses(blocks, shape, seed = 0):
+    """
+    Addresses are shuffled, so parsers and groups have to sort them.
+    """
+    if shape == "int":
+        addrs = [0x1000 + i for i in range(blocks)]
+    elif shape == "tuple":
+        addrs = [(1 + i // 0x1000, i % 0x1000) for i in range(blocks)]
+    else:
+        raise ValueError("Unknow address shape: {}".format(shape))
+
+    random.Random(seed).shuffle(addrs)
+    return addrs
+
+
+def format_addr(addr):
+    if isinstance(addr, tuple):
+        return "({})".format(" ".join("0x{:04x}".format(a) for a in addr))
+    return "0x{:04x}".format(addr)
+
+
+def block_name(addr):
+    if isinstance(addr, tuple):
+        return "BLOCK_{:x}_{:04x}".format(*addr)
+    return "BLOCK_{:04x}".format(addr)
+
+
+def write_csv(path, blocks, fields, shape = "int", density = 1.0, seed = 0):
+    """
+    @output number of rows written
+    """
+    rows = 0
+    fields = layout(fields, density)
+    with open(path, "w") as f:
+        f.write("# synthetic register map\n")
+        for addr in addresses(blocks, shape, seed):
+            name = block_name(addr)
+            f.write(",# addr={}, {}\n".format(format_addr(addr), name))
+            for idx, (bits, shift) in enumerate(fields):
+                if bits == 1:
+                    r = "[{}]".format(shift)
+                else:
+                    r = "[{}:{}]".format(shift + bits - 1, shift)
+                f.write(",{},{}_f{}\n".format(r, name.lower(), idx))
+            f.write("\n")
+            rows += len(fields) + 2
+    return rows + 1
@@ -6,8 +6,10 @@ import csv
 import re
 
 from fields_packer import Field, Block, Group
+from fields_packer import SourceFile
 from fields_packer import ParserWithNameDict
-from fields_packer import CGeneratorBase, CUnionBase
+from fields_packer import CGeneratorBase, CUnionBatch
+from fields_packer import OutputFile, write_depfile
 
 """
 This is a basic class for other parsers.
@@ -39,7 +41,10 @@ class CsvParser(ParserWithNameDict):
 
         return self.TYPE_UNKNOW
 
-    def add_field(self, addr, row):
+    def add_field(self, addr, row, source = None):
+        """
+        @input source: SourceRef of the row, the line is read on demand.
+        """
         bits, shift = Field.extract_range(row[1])
         name = row[2]
         f = Field.new_field(
@@ -47,7 +52,7 @@ class CsvParser(ParserWithNameDict):
             addr = addr,
             bits = bits,
             shift = shift,
-            source = str(row)
+            source = source
         )
         self._add_field(f)
 
@@ -68,6 +73,7 @@ class AccessorCsvParser(CsvParser):
     def _parser(self):
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
             for row in spamreader:
                 row_type = self.cal_row_type(row)
@@ -75,64 +81,32 @@ class AccessorCsvParser(CsvParser):
                     addr = self.extract_addr(row)
                     self._register_block_name(addr, row[2])
                 elif row_type == self.TYPE_FIELD:
-                    self.add_field(addr, row)
+                    self.add_field(addr, row, source.line(spamreader.line_num))
                 # else ignore
 
 
-class AccessorUnion(CUnionBase):
-    TEMPLETE_GETTER = (
-"""
-static inline uint32_t get_{field}(void)
-{{
-	{uname} reg = ({uname})reg_read({addr});
-	return reg.{field};
-}}
-""")
-
-    TEMPLETE_SETTER = (
-"""
-static inline void set_{field}(uint32_t val)
-{{
-	{uname} reg = ({uname})reg_read({addr});
-	reg.{field} = val;
-	reg_write({addr}, reg.val);
-}}
-""")
-
-    def __gen_accessor(self, templete):
-        codes = list()
-        block = self._block
-        fields = block.dump()
-
-        for field in fields:
-            code = templete.format(
-                field = field.name,
-                addr = block.address(),
-                uname = self.name(),
-            )
-            codes.append(code)
-        return "\n".join(codes)
-
-    def _gen_setter(self):
-        return self.__gen_accessor(self.TEMPLETE_SETTER)
-
-    def _gen_getter(self):
-        return self.__gen_accessor(self.TEMPLETE_GETTER)
+class AccessorUnion(CUnionBatch):
+    """
+    Getters, setters and update_<block>() of CUnionBatch, registers are
+    accessed by reg_read() and reg_write() declared in AccessorGenerator.
+    """
 
 
 class AccessorGenerator(CGeneratorBase):
     def __init__(self, group):
         super().__init__(group, AccessorUnion)
 
-    def generate(self):
-        code = super().generate()
-        extern = "\n".join([
+    def generate_iter(self):
+        """
+        generate() joins these chunks, write_to() streams them.
+        """
+        yield "\n".join([
             "#include <stdint.h>",
             "extern void reg_write(uint16_t addr, uint32_t val);",
             "extern uint32_t reg_read(uint16_t addr);",
             "",
         ])
-        return extern + code
+        yield from super().generate_iter()
 
 class GenTop():
     @classmethod
@@ -147,15 +121,16 @@ class GenTop():
 
         Group.check_duplicated_name(group)
         gen = AccessorGenerator(group)
-        code = gen.generate()
-
-        codes = list()
-        codes.append(head)
-        codes.append(code)
-        codes.append(tail)
 
-        full_code = "\n".join(codes)
-        with open(path, "w") as f:
-            f.write(full_code)
+        # stream codes into the file without building the whole header,
+        # the header is only replaced when it is changed.
+        with OutputFile(path) as f:
+            f.write(head + "\n")
+            gen.write_to(f)
+            f.write("\n" + tail)
+        # the Makefile touches the stamp after generating.
+        write_depfile(os.path.join(output, "reg_accessor.d"),
+                      [os.path.join(output, "reg_accessor.stamp")],
+                      [csv, __file__])
 
 GenTop.gen_all("./build/")
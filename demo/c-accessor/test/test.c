@@ -18,4 +18,8 @@ int main(void)
 	set_dev1_stop(1);
 	set_dev1_set(val);
 	set_dev1_stop(0);
+
+	/* set two fields with a single read-modify-write */
+	update_DEVICE0_RESET(MSK_DEVICE0_RESET_dev0_stop | MSK_DEVICE0_RESET_dev0_clk_en,
+			     (R_DEVICE0_RESET){ .dev0_stop = 1, .dev0_clk_en = 1 });
 }
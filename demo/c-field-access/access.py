@@ -6,8 +6,10 @@ import csv
 import re
 
 from fields_packer import Field, Block, Group
-from fields_packer import ParserWithNameDict
+from fields_packer import SourceFile
+from fields_packer import ParserWithNameDict, gen_groups, Watcher
 from fields_packer import CGeneratorBase, CUnionBase, CUnionRaw
+from fields_packer import write_if_changed, write_depfile
 
 """
 This is a basic class for other parsers.
@@ -39,7 +41,10 @@ class CsvParser(ParserWithNameDict):
 
         return self.TYPE_UNKNOW
 
-    def add_field(self, addr, row):
+    def add_field(self, addr, row, source = None):
+        """
+        @input source: SourceRef of the row, the line is read on demand.
+        """
         bits, shift = Field.extract_range(row[1])
         name = row[2]
         f = Field.new_field(
@@ -47,7 +52,7 @@ class CsvParser(ParserWithNameDict):
             addr = addr,
             bits = bits,
             shift = shift,
-            source = str(row)
+            source = source
         )
         self._add_field(f)
 
@@ -71,6 +76,7 @@ class BusMapCsvParser(CsvParser):
     def _parser(self):
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
             for row in spamreader:
                 row_type = self.cal_row_type(row)
@@ -78,7 +84,7 @@ class BusMapCsvParser(CsvParser):
                     addr = self.extract_addr(row)
                     self._register_block_name(addr, row[2])
                 elif row_type == self.TYPE_FIELD:
-                    self.add_field(addr, row)
+                    self.add_field(addr, row, source.line(spamreader.line_num))
                 # else ignore
 
 
@@ -87,8 +93,22 @@ class BusMapUnion(CUnionRaw):
 
 
 class BusMapGenerator(CGeneratorBase):
+    # addresses of the map are indexes of registers in `struct bus_map`.
+    TEMPLETE_BURST_READ = "\n".join([
+        "\tconst volatile {c_type} *reg = (const volatile {c_type} *){addr};",
+        "\tfor (int i = 0; i < {count}; i++)",
+        "\t\tbuf[i] = reg[i];",
+    ])
+
+    TEMPLETE_BURST_WRITE = "\n".join([
+        "\tvolatile {c_type} *reg = (volatile {c_type} *){addr};",
+        "\tfor (int i = 0; i < {count}; i++)",
+        "\t\treg[i] = buf[i];",
+    ])
+
     def __init__(self, group):
-        super().__init__(group, BusMapUnion)
+        # registers are continuous, so they can be saved in one transfer.
+        super().__init__(group, BusMapUnion, burst = True)
 
     def _gen_whole_bus(self, unions):
         head = "struct bus_map {"
@@ -103,10 +123,10 @@ class BusMapGenerator(CGeneratorBase):
         codes.append(tail)
         return "\n".join(codes)
 
-    def generate(self):
-        code = super().generate()
-        whole_bus = self._gen_whole_bus(self._unions)
-        return "\n".join([code, whole_bus])
+    def generate_iter(self):
+        yield from super().generate_iter()
+        yield "\n"
+        yield self._gen_whole_bus(self._unions)
 
 
 """
@@ -134,6 +154,7 @@ class BusCsvParser(CsvParser):
     def _parser(self):
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
             for row in spamreader:
                 row_type = self.cal_row_type(row)
@@ -141,7 +162,7 @@ class BusCsvParser(CsvParser):
                     addr = self.extract_addr(row)
                     self._register_block_name(addr, row[2])
                 elif row_type == self.TYPE_FIELD:
-                    self.add_field(addr, row)
+                    self.add_field(addr, row, source.line(spamreader.line_num))
                 # else ignore
 
 
@@ -214,6 +235,7 @@ class PeripheralCsvParser(CsvParser):
     def _parser(self):
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
             for row in spamreader:
                 row_type = self.cal_row_type(row)
@@ -221,7 +243,7 @@ class PeripheralCsvParser(CsvParser):
                     addr = self.extract_addr(row)
                     self._register_block_name(addr, row[2])
                 elif row_type == self.TYPE_FIELD:
-                    self.add_field(addr, row)
+                    self.add_field(addr, row, source.line(spamreader.line_num))
                 # else ignore
 
 
@@ -263,21 +285,28 @@ class PeripheralGenerator(CGeneratorBase):
     def __init__(self, group):
         super().__init__(group, PeripheralUnion)
 
-    def generate(self):
-        code = super().generate()
-        extern = "\n".join([
+    def generate_iter(self):
+        yield "\n".join([
             "extern void pwrite(uint16_t dev, uint16_t addr, uint32_t val);",
             "extern uint32_t pread(uint16_t dev, uint16_t addr);",
             "",
         ])
-        return extern + code
+        yield from super().generate_iter()
 
 class GenTop():
-    @classmethod
-    def gen_code(cls, csv, parser, generator):
-        parser = parser(csv)
-        group = parser.gen_group()
+    OUT_FILE = "reg_all.h"
+    DEP_FILE = "reg_all.d"
+    # touched by the Makefile after generating
+    STAMP_FILE = "reg_all.stamp"
+
+    CONFIGS = (
+        ("bus-map.csv", BusMapCsvParser, BusMapGenerator),
+        ("bus.csv", BusCsvParser, BusGenerator),
+        ("peripheral.csv", PeripheralCsvParser, PeripheralGenerator),
+    )
 
+    @classmethod
+    def gen_code(cls, group, generator):
         Group.check_duplicated_name(group)
         gen = generator(group)
         code = gen.generate()
@@ -287,27 +316,55 @@ class GenTop():
 
     @classmethod
     def gen_all(cls, output):
-        out_file = "reg_all.h"
-        path = os.path.join(output, out_file)
+        path = os.path.join(output, cls.OUT_FILE)
 
-        head, tail = CGeneratorBase.once_only_header(out_file)
+        head, tail = CGeneratorBase.once_only_header(cls.OUT_FILE)
 
-        configs = (
-            ("bus-map.csv", BusMapCsvParser, BusMapGenerator),
-            ("bus.csv", BusCsvParser, BusGenerator),
-            ("peripheral.csv", PeripheralCsvParser, PeripheralGenerator),
-        )
+        # sources are parsed concurrently, groups keep the order of configs.
+        groups = gen_groups([parser(csv) for csv, parser, _ in cls.CONFIGS])
 
         codes = list()
         codes.append(head)
-        for cfg in configs:
-            code, desc = cls.gen_code(*cfg)
+        for group, (_, _, generator) in zip(groups, cls.CONFIGS):
+            code, desc = cls.gen_code(group, generator)
             codes.append(desc)
             codes.append(code)
         codes.append(tail)
 
+        # keep the mtime of the header if nothing is changed, so includers
+        # aren't recompiled.
         full_code = "\n".join(codes)
-        with open(path, "w") as f:
-            f.write(full_code)
+        write_if_changed(path, full_code)
+        write_depfile(os.path.join(output, cls.DEP_FILE),
+                      [os.path.join(output, cls.STAMP_FILE)],
+                      [csv for csv, _, _ in cls.CONFIGS] + [__file__])
 
-GenTop.gen_all("./build/")
+    @classmethod
+    def watch(cls, output):
+        """
+        Keep groups in memory and regenerate the header when csv files are
+        edited, stop it with Ctrl-C.
+        """
+        def section(generator):
+            def generate(group):
+                code, desc = cls.gen_code(group, generator)
+                return desc + "\n" + code
+            return generate
+
+        head, tail = CGeneratorBase.once_only_header(cls.OUT_FILE)
+        w = Watcher(on_write = lambda path: print("updated", path))
+        for csv, parser, _ in cls.CONFIGS:
+            w.add_group(csv, lambda csv = csv, parser = parser: parser(csv),
+                        [csv])
+        w.add_output(os.path.join(output, cls.OUT_FILE),
+            [(csv, section(generator)) for csv, _, generator in cls.CONFIGS],
+            head = head, tail = tail)
+        try:
+            w.run()
+        except KeyboardInterrupt:
+            pass
+
+if "--watch" in sys.argv:
+    GenTop.watch("./build/")
+else:
+    GenTop.gen_all("./build/")
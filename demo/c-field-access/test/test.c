@@ -28,6 +28,11 @@ int main(void)
 	val = bus_map->r_config0.cfg0;
 	bus_map->r_config1.cfg1 = val;
 
+	/* save and restore all registers of busmap at once */
+	uint16_t bank[BANK_CONFIG0_SIZE];
+	bank_load_CONFIG0(bank);
+	bank_store_CONFIG0(bank);
+
 	/* demo for bus */
 	val = register_field_fetch(DEVICE0_GET, dev0_get);
 	register_field_apply(DEVICE0_SET, dev0_set, val);
@@ -5,8 +5,10 @@ import os
 import csv
 import re
 from fields_packer import Field, Block
+from fields_packer import SourceFile
 from fields_packer import ParserBase, ParserWithNameDict
 from fields_packer import CGeneratorBase, CUnionBase
+from fields_packer import write_if_changed
 
 class CsvParserLike():
     """
@@ -40,7 +42,10 @@ class CsvParserLike():
     def extract_addr(self, row):
         return Field.extract_hex(row[1])
 
-    def add_field(self, addr, row):
+    def add_field(self, addr, row, source = None):
+        """
+        @input source: SourceRef of the row, the line is read on demand.
+        """
         bits, shift = Field.extract_range(row[1])
         name = row[2]
         f = Field.new_field(
@@ -48,7 +53,7 @@ class CsvParserLike():
             addr = addr,
             bits = bits,
             shift = shift,
-            source = str(row)
+            source = source
         )
         self._add_field(f)
 
@@ -65,13 +70,14 @@ class SimpleCsvParser(ParserBase, CsvParserLike):
     def _parser(self):
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
             for row in spamreader:
                 row_type = self.cal_row_type(row)
                 if row_type == self.TYPE_ADDRESS:
                     addr = self.extract_addr(row)
                 elif row_type == self.TYPE_FIELD:
-                    self.add_field(addr, row)
+                    self.add_field(addr, row, source.line(spamreader.line_num))
                 # else ignore
 
 
@@ -105,6 +111,7 @@ class ComplexCsvParser(ParserWithNameDict, CsvParserLike):
     def _parser(self):
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
             for row in spamreader:
                 row_type = self.cal_row_type(row)
@@ -113,7 +120,7 @@ class ComplexCsvParser(ParserWithNameDict, CsvParserLike):
                     # XXX: record block here
                     self._register_block_name(addr, row[2])
                 elif row_type == self.TYPE_FIELD:
-                    self.add_field(addr, row)
+                    self.add_field(addr, row, source.line(spamreader.line_num))
                 # else ignore
 
 class RawCsvParser(ParserBase, CsvParserLike):
@@ -137,6 +144,7 @@ class RawCsvParser(ParserBase, CsvParserLike):
 
         with open(self._csv, "r") as csvfile:
             spamreader = csv.reader(csvfile)
+            source = SourceFile(self._csv)
             addr = None
 
             block = None
@@ -155,7 +163,7 @@ class RawCsvParser(ParserBase, CsvParserLike):
                         addr = addr,
                         bits = bits,
                         shift = shift,
-                        source = str(row)
+                        source = source.line(spamreader.line_num)
                     )
                     block.add_field(f)
                 # else ignore
@@ -205,9 +213,8 @@ class DemoPacker():
         gen = generator(group)
         # generate code with group.
         code = gen.generate()
-        # output codes
-        with open(opath, "w") as f:
-            f.write(code)
+        # output codes, unchanged files are not touched.
+        write_if_changed(opath, code)
 
     @classmethod
     def gen_demos(cls, csv_file, obase):
@@ -1,5 +1,25 @@
 from .core import Field, Block, Group
+from .core import FieldTable, FieldView
+from .core import SourceFile, SourceRef
 from .core import GeneratorBase
 from .core import ParserBase, ParserWithNameDict
+from .validator import Validator, Finding
 
 from .impl_c import CGeneratorBase, CUnionBase, CUnionRaw
+from .impl_c import CUnionAccessor, CUnionBatch
+from .impl_c import CUnionShadow, CShadowGenerator
+from .impl_c import CDescriptors
+from .phash import PerfectHash
+from .cache import RenderCache
+from .template import compile_template, render_template
+from .instrument import Recorder
+from .codec import compile_codec, compile_codecs
+from .dump import DumpDecoder
+from .index import GroupIndex
+
+from .snapshot import save_group, load_group
+from .aio import gather_groups, gen_groups
+from .watch import Watcher
+from .output import OutputFile, write_if_changed, write_depfile
+
+from .loader import CsvBulkParser
@@ -0,0 +1,49 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import List, Optional, Sequence
+
+from .core import Group, ParserBase
+
+"""
+Parse many sources concurrently with asyncio:
+
+    groups = await gather_groups([BusParser("bus.csv"), ...])
+
+    # or from synchronous code, e.g. a GenTop
+    groups = gen_groups(parsers, executor = ProcessPoolExecutor())
+
+Every parser runs ParserBase.gen_group_async(), so reading sources overlaps
+in threads of the executor, or parsing runs in parallel with processes.
+Groups are returned in the order of parsers, whichever finishes first.
+"""
+
+
+async def gather_groups(parsers: Sequence[ParserBase],
+        executor: Optional[Executor] = None,
+        limit: Optional[int] = None) -> List[Group]:
+    """
+    @input limit: max number of parsers running at a time, e.g. for sources
+        on a slow network file system. No limit by default.
+    @output groups in the order of parsers.
+    """
+    if limit is None:
+        return list(await asyncio.gather(
+            *(p.gen_group_async(executor) for p in parsers)))
+
+    sem = asyncio.Semaphore(limit)
+
+    async def parse(parser):
+        async with sem:
+            return await parser.gen_group_async(executor)
+
+    return list(await asyncio.gather(*(parse(p) for p in parsers)))
+
+
+def gen_groups(parsers: Sequence[ParserBase],
+        executor: Optional[Executor] = None,
+        limit: Optional[int] = None) -> List[Group]:
+    """
+    gather_groups() in a new event loop, it can't be called from a running
+    loop.
+    """
+    return asyncio.run(gather_groups(parsers, executor, limit))
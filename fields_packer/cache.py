@@ -0,0 +1,230 @@
+import hashlib
+import io
+import os
+import pickle
+import sqlite3
+from types import CodeType, FunctionType
+from typing import Dict, Iterable, Optional
+
+"""
+Persistent cache of rendered code.
+
+Entries are addressed by the content of a union: the class (templates and
+code of methods), attributes of the instance, e.g. given by a
+functools.partial factory, the block name, addresses and fields. So an
+entry is reused only when rendering it again would give the same code.
+
+Helpers outside union classes (Field, compile_template ...) are covered by
+a digest of sources of fields_packer, so upgrading it invalidates entries.
+
+All entries are in one sqlite3 file, lookups of a whole group are batched.
+"""
+
+# sqlite limits the number of host parameters in a statement.
+_BATCH = 500
+
+# bump it when keys are computed differently.
+FORMAT = 2
+
+_salt = None
+
+
+def _package_salt() -> bytes:
+    """
+    Digest of FORMAT and sources of fields_packer, computed once.
+    """
+    global _salt
+    if _salt is None:
+        h = hashlib.sha256(str(FORMAT).encode())
+        pkg = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(pkg)):
+            if name.endswith(".py"):
+                h.update(name.encode())
+                with open(os.path.join(pkg, name), "rb") as f:
+                    h.update(f.read())
+        _salt = h.digest()
+    return _salt
+
+
+def _digest_code(h, code: CodeType) -> None:
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            _digest_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+def _content_bytes(content) -> bytes:
+    """
+    Serialize values of fields, pickle is several times faster than repr().
+    The memo is disabled, so equal values are always serialized the same
+    way no matter whether they are the same objects.
+    """
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, 4)
+    pickler.fast = True
+    try:
+        pickler.dump(content)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return repr(content).encode()
+    return buf.getvalue()
+
+
+def _digest_value(h, value) -> None:
+    if isinstance(value, (staticmethod, classmethod)):
+        value = value.__func__
+    elif isinstance(value, property):
+        for f in (value.fget, value.fset, value.fdel):
+            if f is not None:
+                _digest_value(h, f)
+        return
+
+    if isinstance(value, FunctionType):
+        _digest_code(h, value.__code__)
+    elif isinstance(value, (str, bytes, int, float, bool, tuple, type(None))):
+        h.update(repr(value).encode())
+
+
+class RenderCache():
+    """
+    Size bounded cache of rendered code, the least recently used entries are
+    evicted when the total size of codes is over `max_bytes`.
+
+    Link to: CGeneratorBase
+    """
+
+    _identities = dict()
+
+    def __init__(self, path: str, max_bytes: int = 64 << 20):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS render ("
+            "key TEXT PRIMARY KEY, code TEXT, size INTEGER, used INTEGER)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS render_used ON render (used)")
+
+        used, size = self._db.execute(
+            "SELECT MAX(used), SUM(size) FROM render").fetchone()
+        self._clock = (used or 0) + 1
+        self._size = size or 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+
+    @classmethod
+    def identity(cls, union_class: type) -> bytes:
+        """
+        Digest of templates and methods of the union class and its bases.
+        """
+        ident = cls._identities.get(union_class, None)
+        if ident is None:
+            h = hashlib.sha256()
+            for klass in union_class.__mro__:
+                if klass is object:
+                    continue
+                h.update("{}.{}".format(
+                    klass.__module__, klass.__qualname__).encode())
+                for name, value in sorted(vars(klass).items()):
+                    h.update(name.encode())
+                    _digest_value(h, value)
+            ident = cls._identities[union_class] = h.digest()
+        return ident
+
+    @classmethod
+    def key(cls, union) -> str:
+        """
+        Content address of a union instance.
+
+        Field.source is ignored, it doesn't change the rendered code.
+        Attributes of the union except the block are included, so unions
+        configured differently, e.g. by functools.partial, don't share keys.
+        """
+        block = union._block
+        fields = [(f.name, f.addr, f.bitmask, f.bits, f.shift,
+                   f.group, f.default, f.extra) for f in block.dump()]
+        config = sorted((k, v) for k, v in vars(union).items()
+                        if k != "_block")
+        content = (block.name(), block._addr, block.address(), fields, config)
+
+        h = hashlib.sha256(_package_salt())
+        h.update(cls.identity(type(union)))
+        h.update(_content_bytes(content))
+        return h.hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(keys)
+        found = dict()
+        for i in range(0, len(keys), _BATCH):
+            batch = keys[i:i + _BATCH]
+            sql = "SELECT key, code FROM render WHERE key IN ({})".format(
+                ",".join("?" * len(batch)))
+            found.update(self._db.execute(sql, batch))
+
+        if found:
+            hits = list(found)
+            with self._db:
+                for i in range(0, len(hits), _BATCH):
+                    batch = hits[i:i + _BATCH]
+                    sql = "UPDATE render SET used = ? WHERE key IN ({})".format(
+                        ",".join("?" * len(batch)))
+                    self._db.execute(sql, [self._clock] + batch)
+            self._clock += 1
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key, None)
+
+    def put_many(self, codes: Dict[str, str]) -> None:
+        if not codes:
+            return
+
+        rows = [(k, c, len(c), self._clock) for k, c in codes.items()]
+        with self._db:
+            for i in range(0, len(rows), _BATCH):
+                batch = [r[0] for r in rows[i:i + _BATCH]]
+                sql = "SELECT SUM(size) FROM render WHERE key IN ({})".format(
+                    ",".join("?" * len(batch)))
+                self._size -= self._db.execute(sql, batch).fetchone()[0] or 0
+            self._db.executemany(
+                "INSERT OR REPLACE INTO render VALUES (?, ?, ?, ?)", rows)
+        self._size += sum(r[2] for r in rows)
+        self._clock += 1
+
+        if self._size > self._max_bytes:
+            self._evict()
+
+    def put(self, key: str, code: str) -> None:
+        self.put_many({key: code})
+
+    def _evict(self) -> None:
+        """
+        Drop the least recently used entries until the cache is at most 3/4
+        of max_bytes.
+        """
+        target = self._max_bytes * 3 // 4
+        with self._db:
+            rows = self._db.execute(
+                "SELECT key, size FROM render ORDER BY used")
+            drop = list()
+            for key, size in rows:
+                if self._size <= target:
+                    break
+                drop.append((key, ))
+                self._size -= size
+            rows.close()
+            self._db.executemany("DELETE FROM render WHERE key = ?", drop)
+
+    def clear(self) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM render")
+        self._size = 0
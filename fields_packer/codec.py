@@ -0,0 +1,188 @@
+import keyword
+from functools import lru_cache
+from typing import Sequence, Tuple, Type
+
+from .core import Block
+
+"""
+Compile codecs of blocks, which pack and unpack raw register values.
+
+    Codec = compile_codec(block)
+    reg = Codec._decode(0x1234)
+    reg.mode = 2
+    raw = reg._encode()
+
+    Codec._unpack(0x1234)                   # tuple of values
+    Codec._pack(*values)
+    Codec._decode_many(raws), Codec._unpack_many(raws)
+    Codec._encode_many(regs), Codec._pack_many(rows)
+
+The codec is a `__slots__` class with an attribute for every field, in the
+order of Block.dump(). Methods are generated with the masks and shifts as
+constants, so there is no loop over fields or attribute lookups of Field.
+Like namedtuple, methods start with an underscore so they don't conflict
+with names of fields.
+
+Values are masked by the width of fields when encoding, like C bitfields,
+and bits not covered by any field are 0.
+"""
+
+
+# parameters and locals of the generated methods, fields are parameters of
+# __init__() too.
+_RESERVED = frozenset((
+    "self", "cls", "other", "raw", "raws", "regs", "rows", "decode"))
+
+
+def _check_names(names, rename):
+    seen = set()
+    res = list()
+    for idx, name in enumerate(names):
+        if (not name.isidentifier() or keyword.iskeyword(name)
+                or name.startswith("_") or name in _RESERVED
+                or name in seen):
+            if not rename:
+                raise ValueError(
+                    "Field name can't be used by codec: {!r}".format(name))
+            name = "_{}".format(idx)
+        seen.add(name)
+        res.append(name)
+    return res
+
+
+def _class_name(name):
+    name = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+    if not name.isidentifier() or keyword.iskeyword(name):
+        name = "_" + name
+    return name
+
+
+@lru_cache(maxsize = None)
+def _compile(name: str, layout: Tuple[Tuple[str, int, int, int], ...],
+        rename: bool) -> type:
+    names = _check_names([f[0] for f in layout], rename)
+    args = ["_v{}".format(i) for i in range(len(layout))]
+
+    def get(src, bits, shift):
+        mask = (1 << bits) - 1
+        if shift:
+            return "({} >> {}) & 0x{:x}".format(src, shift, mask)
+        return "{} & 0x{:x}".format(src, mask)
+
+    def put(src, bits, shift):
+        mask = (1 << bits) - 1
+        if shift:
+            return "({} & 0x{:x}) << {}".format(src, mask, shift)
+        return "{} & 0x{:x}".format(src, mask)
+
+    def join(items, empty = "0"):
+        return " | ".join(items) or empty
+
+    def tuple_of(items):
+        return "({}{})".format(", ".join(items), "," if len(items) == 1 else "")
+
+    gets = [get("raw", bits, shift) for _, bits, shift, _ in layout]
+    puts = [put(a, bits, shift)
+            for a, (_, bits, shift, _) in zip(args, layout)]
+    attr_puts = [put("self." + n, bits, shift)
+                 for n, (_, bits, shift, _) in zip(names, layout)]
+
+    lines = [
+        "class {}:".format(_class_name(name)),
+        "    __slots__ = {}".format(tuple_of([repr(n) for n in names])),
+        "    _fields = __slots__",
+        "    _defaults = {}".format(tuple_of([repr(f[3]) for f in layout])),
+        "",
+        "    def __init__(self{}):".format("".join(
+            ", {} = {!r}".format(n, f[3]) for n, f in zip(names, layout))),
+    ]
+    lines += ["        self.{0} = {0}".format(n) for n in names] or ["        pass"]
+    lines += [
+        "",
+        "    @classmethod",
+        "    def _decode(cls, raw):",
+        "        self = _new(cls)",
+    ]
+    lines += ["        self.{} = {}".format(n, g) for n, g in zip(names, gets)]
+    lines += [
+        "        return self",
+        "",
+        "    def _encode(self):",
+        "        return {}".format(join(attr_puts)),
+        "",
+        "    @staticmethod",
+        "    def _unpack(raw):",
+        "        return {}".format(tuple_of(gets)),
+        "",
+        "    @staticmethod",
+        "    def _pack({}):".format(", ".join(args)),
+        "        return {}".format(join(puts)),
+        "",
+        "    @classmethod",
+        "    def _decode_many(cls, raws):",
+        "        decode = cls._decode",
+        "        return [decode(raw) for raw in raws]",
+        "",
+        "    @staticmethod",
+        "    def _encode_many(regs):",
+        "        return [{} for self in regs]".format(join(attr_puts)),
+        "",
+        "    @staticmethod",
+        "    def _unpack_many(raws):",
+        "        return [{} for raw in raws]".format(tuple_of(gets)),
+        "",
+        "    @staticmethod",
+        "    def _pack_many(rows):",
+        "        return [{} for {} in rows]".format(
+            join(puts), tuple_of(args) if args else "_"),
+        "",
+        "    def _asdict(self):",
+        "        return {{{}}}".format(", ".join(
+            "{0!r}: self.{0}".format(n) for n in names)),
+        "",
+        "    def __eq__(self, other):",
+        "        if type(other) is not type(self):",
+        "            return NotImplemented",
+        "        return self._encode() == other._encode()",
+        "",
+        "    __hash__ = None",
+        "",
+        "    def __int__(self):",
+        "        return self._encode()",
+        "",
+        "    def __repr__(self):",
+        "        return {!r}.format({})".format(
+            _class_name(name) + "(" + ", ".join(
+                "{}={{!r}}".format(n) for n in names) + ")",
+            ", ".join("self." + n for n in names)),
+        "",
+    ]
+
+    namespace = dict(_new = object.__new__)
+    source = "\n".join(lines)
+    exec(compile(source, "<codec {}>".format(name), "exec"), namespace)
+    codec = namespace[_class_name(name)]
+    codec._source = source
+    return codec
+
+
+def compile_codec(block: Block, rename: bool = False) -> Type:
+    """
+    Codecs are cached by the name and the layout of blocks, so blocks with
+    the same layout share a class. Compile it again after the block changes.
+
+    @input rename: replace invalid, reserved (e.g. `self`, `raw`) or
+        duplicated names of fields with `_<index>` like namedtuple, else
+        ValueError is raised.
+    """
+    layout = tuple(
+        (f.name, f.bits, f.shift, f.default if type(f.default) is int else 0)
+        for f in block.dump())
+    return _compile(block.name(), layout, rename)
+
+
+def compile_codecs(blocks: Sequence[Block], rename: bool = False) -> dict:
+    """
+    @output block name -> codec
+    """
+    return {b.name(): compile_codec(b, rename) for b in blocks}
@@ -1,7 +1,14 @@
+import asyncio
 import re
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+from operator import attrgetter
 from typing import Sequence, Optional, Callable, Any
 from collections import namedtuple
 
+from . import instrument
+from .validator import Validator
+
 """
 Hierarchy:
               Group          |   Another Group
@@ -18,6 +25,10 @@ Field ... Field  | ......... | ....
 - Blocks in the same gruops have same `parser` and `generator`.
 """
 
+# marks a memoized value which is not computed yet
+_NOT_CACHED = object()
+
+
 class Colors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -29,6 +40,110 @@ class Colors:
     UNDERLINE = '\033[4m'
 
 
+class SourceFile():
+    """
+    A source file which fields come from.
+
+    Fields can keep a SourceRef to a line of the file instead of a copy of
+    the line, the text is read from the file only when it is asked for.
+
+    Link to: class SourceRef
+    """
+    def __init__(self, path: str, encoding: str = "utf-8"):
+        self._path = path
+        self._encoding = encoding
+        # offsets of line starts, built by the first line() lookup
+        self._lines = None
+
+    def __str__(self):
+        return str(self._path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lines"] = None
+        return state
+
+    def path(self) -> str:
+        return self._path
+
+    def at(self, offset: int) -> 'SourceRef':
+        """
+        Reference the line starts at the byte offset.
+        """
+        return SourceRef(self, offset, False)
+
+    def line(self, lineno: int) -> 'SourceRef':
+        """
+        Reference the line by its number, starts from 1 like csv.reader.
+        """
+        return SourceRef(self, lineno, True)
+
+    def _read_at(self, offset: int) -> str:
+        with open(self._path, "rb") as f:
+            f.seek(offset)
+            line = f.readline()
+        return line.decode(self._encoding).rstrip("\r\n")
+
+    def _read_line(self, lineno: int) -> str:
+        if self._lines is None:
+            lines = array("Q", [0])
+            with open(self._path, "rb") as f:
+                for line in f:
+                    lines.append(lines[-1] + len(line))
+            self._lines = lines
+
+        if not 0 < lineno < len(self._lines):
+            raise IndexError("{}: no line {}".format(self._path, lineno))
+        return self._read_at(self._lines[lineno - 1])
+
+
+class SourceRef():
+    """
+    A lazy reference to a line of SourceFile, str() returns the text.
+    """
+    __slots__ = ("_file", "_pos", "_is_line")
+
+    def __init__(self, file: SourceFile, pos: int, is_line: bool):
+        self._file = file
+        self._pos = pos
+        self._is_line = is_line
+
+    def file(self) -> SourceFile:
+        return self._file
+
+    def location(self) -> str:
+        if self._is_line:
+            return "{}:{}".format(self._file, self._pos)
+        return "{}@{}".format(self._file, self._pos)
+
+    def text(self) -> str:
+        if self._is_line:
+            return self._file._read_line(self._pos)
+        return self._file._read_at(self._pos)
+
+    def __str__(self):
+        return self.text()
+
+    def __repr__(self):
+        try:
+            text = repr(self.text())
+        except (OSError, IndexError):
+            text = "<unavailable>"
+        return "{}: {}".format(self.location(), text)
+
+    def __eq__(self, other):
+        if not isinstance(other, SourceRef):
+            return NotImplemented
+        return (self._file is other._file and self._pos == other._pos
+                and self._is_line == other._is_line)
+
+    def __hash__(self):
+        return hash((id(self._file), self._pos, self._is_line))
+
+    def __reduce__(self):
+        return (SourceRef, (self._file, self._pos, self._is_line))
+
+
 _Field = namedtuple("Field", [
     "name",
     "addr",
@@ -114,35 +229,267 @@ class Field(_Field):
     def range(self):
         return self.cal_range(self.bits, self.shift)
 
+    def source_text(self) -> Optional[str]:
+        """
+        Materialize the source, it can be a str or a SourceRef.
+        """
+        return None if self.source is None else str(self.source)
+
+
+class FieldTable():
+    """
+    Columnar storage of fields for huge register maps.
+
+    bits, shift and default are kept in `array` columns, addresses are
+    interned, and names are packed into one utf-8 buffer indexed by offsets.
+    group, source and extra are usually None, so they are kept in a sparse
+    dict. bitmask is calculated from bits and shift on demand.
+
+    append() returns a FieldView, which can be used as a Field.
+
+    Link to: class FieldView
+    """
+    def __init__(self):
+        self._name_buf = bytearray()
+        # explicit widths, "L" is 32 bits on Windows and 64 bits elsewhere.
+        self._name_end = array("Q")
+        self._addrs = list()
+        self._addr_ids = dict()
+        self._addr_col = array("I")
+        self._bits = array("H")
+        self._shift = array("H")
+        self._default = array("Q")
+        # row -> (group, default, source, extra), only for the rare values
+        # which don't fit in columns.
+        self._sparse = dict()
+
+    def __len__(self):
+        return len(self._bits)
+
+    def append(self, field: Field) -> 'FieldView':
+        row = len(self._bits)
+
+        addr_id = self._addr_ids.get(field.addr, None)
+        if addr_id is None:
+            addr_id = self._addr_ids[field.addr] = len(self._addrs)
+            self._addrs.append(field.addr)
+
+        default = field.default
+        sparse = (field.group, default, field.source, field.extra)
+        if not (type(default) is int and 0 <= default < (1 << 64)):
+            default = 0
+        elif sparse == (None, default, None, None):
+            sparse = None
+
+        self._name_buf += field.name.encode()
+        self._name_end.append(len(self._name_buf))
+        self._addr_col.append(addr_id)
+        self._bits.append(field.bits)
+        self._shift.append(field.shift)
+        self._default.append(default)
+        if sparse is not None:
+            self._sparse[row] = sparse
+
+        return FieldView(self, row)
+
+    def name(self, row: int) -> str:
+        start = self._name_end[row - 1] if row else 0
+        return self._name_buf[start:self._name_end[row]].decode()
+
+    def view(self, row: int) -> 'FieldView':
+        return FieldView(self, row)
+
+    def field(self, row: int) -> Field:
+        """
+        Materialize the row as a Field.
+        """
+        bits = self._bits[row]
+        shift = self._shift[row]
+        group, default, source, extra = self._sparse.get(
+            row, (None, self._default[row], None, None))
+
+        return Field(
+            name = self.name(row),
+            addr = self._addrs[self._addr_col[row]],
+            bits = bits,
+            bitmask = Field.cal_bitmask(bits, shift),
+            shift = shift,
+            group = group,
+            default = default,
+            source = source,
+            extra = extra,
+        )
+
+
+class FieldView():
+    """
+    A lightweight reference to a row of FieldTable.
+
+    It has the same attributes and methods as Field, and it is pickled as a
+    Field. Like a Field it can be indexed, unpacked, compared and hashed as
+    the tuple of its values. It isn't a tuple though, so isinstance() checks
+    of tuple or Field fail, use field() to get one.
+    """
+    __slots__ = ("_table", "_row")
+
+    _fields = Field._fields
+
+    def __init__(self, table: FieldTable, row: int):
+        self._table = table
+        self._row = row
+
+    @property
+    def name(self):
+        return self._table.name(self._row)
+
+    @property
+    def addr(self):
+        table = self._table
+        return table._addrs[table._addr_col[self._row]]
+
+    @property
+    def bits(self):
+        return self._table._bits[self._row]
+
+    @property
+    def shift(self):
+        return self._table._shift[self._row]
+
+    @property
+    def bitmask(self):
+        return Field.cal_bitmask(self.bits, self.shift)
+
+    @property
+    def group(self):
+        return self.__sparse(0)
+
+    @property
+    def default(self):
+        sparse = self._table._sparse.get(self._row, None)
+        if sparse is None:
+            return self._table._default[self._row]
+        return sparse[1]
+
+    @property
+    def source(self):
+        return self.__sparse(2)
+
+    @property
+    def extra(self):
+        return self.__sparse(3)
+
+    def __sparse(self, idx):
+        sparse = self._table._sparse.get(self._row, None)
+        return None if sparse is None else sparse[idx]
+
+    def range(self):
+        return Field.cal_range(self.bits, self.shift)
+
+    def source_text(self) -> Optional[str]:
+        return Field.source_text(self)
+
+    def field(self) -> Field:
+        return self._table.field(self._row)
+
+    def _asdict(self) -> dict:
+        return self.field()._asdict()
+
+    def _replace(self, **kw) -> Field:
+        """
+        The row isn't changed, a new Field is returned like Field._replace().
+        """
+        return self.field()._replace(**kw)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, idx):
+        return self.field()[idx]
+
+    def __iter__(self):
+        return iter(self.field())
+
+    def __eq__(self, other):
+        if isinstance(other, FieldView):
+            other = other.field()
+        elif not isinstance(other, tuple):
+            return NotImplemented
+        return self.field() == other
+
+    def __hash__(self):
+        return hash(self.field())
+
+    def __repr__(self):
+        return repr(self.field())
+
+    def __reduce__(self):
+        return (Field._make, (tuple(self.field()), ))
+
 
 class BlockCreator():
     """
     This is a helper class for creating Block.
     The create() will set funtions automatically.
 
+    Give `max_bits` the width of unions, e.g. CUnionBase.MAX_BITS, to refuse
+    wide fields while parsing, else generators check them before rendering.
+
     Link to: class Block
     """
-    def __init__(self, reverse = False, checker = None, sortby = None, addr_parser = None):
+    def __init__(self, reverse = False, checker = None, sortby = None, addr_parser = None,
+            table = None, max_bits = None):
         self._checker = checker
         self._sortby = sortby
         self._parser = addr_parser
         self._reverse = reverse
+        self._table = table
+        self._max_bits = max_bits
 
     def create(self, name, addr, fields = None):
         block = Block(name, addr, fields,
                       checker = self._checker,
                       sortby = self._sortby,
-                      parse_addr = self._parser)
+                      parse_addr = self._parser,
+                      table = self._table,
+                      max_bits = self._max_bits)
 
         block.reverse = self._reverse
         return block
 
+    def bind(self, block: 'Block') -> None:
+        """
+        Set functions of the creator to the block again, e.g. after the
+        block is pickled, which drops them.
+        """
+        block._bind(self._checker, self._sortby, self._parser)
+
 
 class Block():
     BlockCreator = BlockCreator
 
     class IllegalFieldAddr(ValueError): pass
 
+    class FieldOverlapped(ValueError):
+        """
+        `overlap` is the mask of bits used by both the field and the block.
+        """
+        def __init__(self, block: 'Block', field: Field, overlap: int):
+            self.block = block
+            self.field = field
+            self.overlap = overlap
+            super().__init__(
+                "Field {} overlaps bits 0x{:x} in block {}".format(
+                    field.name, overlap, block))
+
+    class FieldOverflow(ValueError):
+        def __init__(self, block: 'Block', field: Field, max_bits: int):
+            self.block = block
+            self.field = field
+            self.max_bits = max_bits
+            super().__init__(
+                "Field {}{} exceeds {} bits of block {}".format(
+                    field.name, field.range(), max_bits, block))
+
     BlockCheckerType = Callable[['Block', Field], bool]
     BlockSortbyType = Callable[[Field], Any]
     BlockParseAddress = Callable[['Block'], Any]
@@ -154,16 +501,46 @@ class Block():
             fields: Optional[Sequence[Field]] = None,
             checker: Optional[BlockCheckerType] = None,
             sortby: Optional[BlockSortbyType] = None,
-            parse_addr: Optional[BlockParseAddress] = None):
+            parse_addr: Optional[BlockParseAddress] = None,
+            table: Optional[FieldTable] = None,
+            max_bits: Optional[int] = None):
+        """
+        Fields are stored in `table` when it is given, and the block keeps
+        FieldViews only.
 
+        The block keeps the OR of bitmasks of its fields, a field overlapping
+        others or beyond `max_bits` is refused.
+        """
         self._name = name.strip()
         self._addr = address
-        self._fields = (fields or []).copy()
+        self._table = table
+        self._max_bits = max_bits
+        self._occupied = 0
+        self._fields = list()
+        if fields:
+            self._occupied = self.__occupy(fields)
+            self._fields.extend(self.__store(fields))
         self.__sortby = sortby
+        self.__sort_key = sortby or attrgetter("shift")
         self.__checker = checker
         self.__parse_addr = parse_addr
 
-        self.reverse = False
+        # _fields is sorted lazily, the flag is cleared by any change.
+        self._sorted = False
+        self.__reverse = False
+        self.__address = _NOT_CACHED
+        # groups containing this block, they are notified by _changed().
+        self._groups = list()
+
+    @property
+    def reverse(self) -> bool:
+        return self.__reverse
+
+    @reverse.setter
+    def reverse(self, reverse: bool) -> None:
+        if reverse != self.__reverse:
+            self.__reverse = reverse
+            self._sorted = False
 
     def __str__(self):
         return "{name}@({addr})".format(name = self._name, addr = self._addr)
@@ -178,10 +555,74 @@ class Block():
         return self._name
 
     def address(self):
-        if self.__parse_addr:
-            return self.__parse_addr(self)
-        else:
-            return self._addr
+        """
+        The result is memoized until the block is changed.
+        """
+        address = self.__address
+        if address is _NOT_CACHED:
+            if self.__parse_addr:
+                address = self.__parse_addr(self)
+            else:
+                address = self._addr
+            self.__address = address
+        return address
+
+    def _bind(self, checker, sortby, parse_addr) -> None:
+        """
+        Link to: BlockCreator.bind()
+        """
+        self.__checker = checker
+        self.__sortby = sortby
+        self.__sort_key = sortby or attrgetter("shift")
+        self.__parse_addr = parse_addr
+        self._sorted = False
+        self.__address = _NOT_CACHED
+
+    def occupied(self) -> int:
+        """
+        Mask of bits used by fields.
+        """
+        return self._occupied
+
+    def check_width(self, max_bits: int) -> None:
+        """
+        Raise FieldOverflow for the first field beyond `max_bits`, e.g. the
+        width of unions, for blocks created without max_bits.
+        """
+        if not self._occupied >> max_bits:
+            return
+        for field in self._fields:
+            if field.bitmask >> max_bits:
+                raise self.FieldOverflow(self, field, max_bits)
+
+    def __occupy(self, fields) -> int:
+        """
+        Check bits of fields and return the new occupancy, nothing is changed
+        if any field is refused.
+        """
+        occupied = self._occupied
+        max_bits = self._max_bits
+        for field in fields:
+            mask = field.bitmask
+            if occupied & mask:
+                raise self.FieldOverlapped(self, field, occupied & mask)
+            if max_bits is not None and mask >> max_bits:
+                raise self.FieldOverflow(self, field, max_bits)
+            occupied |= mask
+        return occupied
+
+    def __store(self, fields):
+        table = self._table
+        if table is None:
+            return fields
+        return [f if type(f) is FieldView and f._table is table
+                else table.append(f) for f in fields]
+
+    def _changed(self) -> None:
+        self._sorted = False
+        self.__address = _NOT_CACHED
+        for group in self._groups:
+            group._changed(self)
 
     def add_field(self, field: Field) -> None:
         if not self.check(field):
@@ -189,21 +630,70 @@ class Block():
                 self._addr, field.addr)
             raise self.IllegalFieldAddr(err)
 
+        self._occupied = self.__occupy((field, ))
+        if self._table is not None:
+            field, = self.__store((field, ))
         self._fields.append(field)
+        self._changed()
+
+    def add_fields(self, fields: Sequence[Field]) -> None:
+        """
+        Add fields in batch, it has the same checks as add_field().
+        """
+        for field in fields:
+            if not self.check(field):
+                err = "Error with adding field: block._addr:{} field.addr: {}".format(
+                    self._addr, field.addr)
+                raise self.IllegalFieldAddr(err)
+
+        self._occupied = self.__occupy(fields)
+        self._fields.extend(self.__store(fields))
+        self._changed()
+
+    def _adopt(self, fields: Sequence[Field], occupied: int, nbits: int) -> None:
+        """
+        Add fields known to belong to the block, e.g. loaded from a snapshot,
+        without checking their addresses.
+
+        `occupied` is the OR of their bitmasks and `nbits` the sum of their
+        bits. Fields are only checked one by one when these tell an overlap
+        or overflow, to raise the same errors as add_fields().
+        """
+        max_bits = self._max_bits
+        if self._occupied & occupied or bin(occupied).count("1") != nbits or \
+                (max_bits is not None and occupied >> max_bits):
+            self.__occupy(fields)
+        self._occupied |= occupied
+        self._fields.extend(self.__store(fields))
+        self._changed()
 
     def dump(self) -> Sequence[Field]:
         self.sort()
         return self._fields.copy()
 
     def sort(self) -> None:
-        if self.__sortby:
-            self._fields = sorted(
-                    self._fields, reverse = self.reverse,
-                    key=lambda f: self.__sortby(f))
-        else:
-            self._fields = sorted(
-                    self._fields, reverse = self.reverse,
-                    key=lambda f: f.shift)
+        """
+        Sort fields only when the block is changed since last sort.
+        """
+        if self._sorted:
+            return
+
+        self._fields.sort(key = self.__sort_key, reverse = self.__reverse)
+        self._sorted = True
+
+        rec = instrument._active
+        if rec is not None:
+            rec.count("block_sorts")
+
+    def options(self) -> dict:
+        """
+        Functions given by BlockCreator, None means the default behavior.
+        """
+        return dict(
+            checker = self.__checker,
+            sortby = self.__sortby,
+            parse_addr = self.__parse_addr,
+        )
 
     def check(self, field: Field) -> bool:
         if self.__checker:
@@ -211,6 +701,31 @@ class Block():
         else:
             return self._addr == field.addr
 
+    def __getstate__(self):
+        """
+        Functions from BlockCreator are often lambdas which can't be pickled,
+        so the block is sorted and its address is memoized before pickling,
+        and the pickled copy works without them. Fields are pickled as plain
+        tuples, which is much faster than pickling namedtuples one by one.
+        """
+        self.sort()
+        self.address()
+
+        state = self.__dict__.copy()
+        state["_fields"] = [tuple(f) for f in self._fields]
+        state["_groups"] = list()
+        state["_table"] = None
+        state["_Block__sortby"] = None
+        state["_Block__sort_key"] = attrgetter("shift")
+        state["_Block__checker"] = None
+        state["_Block__parse_addr"] = None
+        return state
+
+    def __setstate__(self, state):
+        new = tuple.__new__
+        state["_fields"] = [new(Field, f) for f in state["_fields"]]
+        self.__dict__.update(state)
+
 
 class Group():
     class IllegalBlock(ValueError): pass
@@ -229,9 +744,38 @@ class Group():
         self._desc = gdesc
         self._blocks = (blocks or []).copy()
         self.__sortby = sortby
+        self.__sort_key = sortby or Block.address
         self.__checker = checker
 
-        self.reverse = False
+        # sort keys are computed once per change of block, and _blocks is
+        # sorted lazily like Block._fields.
+        self.__keys = dict()
+        self._sorted = False
+        self.__reverse = False
+        # bumped by every change of blocks, indexes of the group compare it
+        # to find they are stale.
+        self._version = 0
+
+        for block in self._blocks:
+            block._groups.append(self)
+
+    @property
+    def reverse(self) -> bool:
+        return self.__reverse
+
+    @reverse.setter
+    def reverse(self, reverse: bool) -> None:
+        if reverse != self.__reverse:
+            self.__reverse = reverse
+            self._sorted = False
+
+    def __setstate__(self, state):
+        """
+        Pickled blocks forget their groups, link them to the copy again.
+        """
+        self.__dict__.update(state)
+        for block in self._blocks:
+            block._groups.append(self)
 
     def __str__(self):
         return "Group{name}: {desc}".format(
@@ -243,6 +787,17 @@ class Group():
             raise self.IllegalBlock("Error with adding block")
 
         self._blocks.append(block)
+        block._groups.append(self)
+        self._sorted = False
+        self._version += 1
+
+    def _changed(self, block: Block) -> None:
+        """
+        Called by blocks of this group when they are changed.
+        """
+        self._sorted = False
+        self._version += 1
+        self.__keys.pop(block, None)
 
     def dump(self) -> Sequence[Block]:
         self._sort()
@@ -255,14 +810,38 @@ class Group():
             b.show()
 
     def _sort(self) -> None:
-        if self.__sortby:
-            self._blocks = sorted(
-                self._blocks, reverse = self.reverse,
-                key=lambda b: self.__sortby(b))
+        if self._sorted:
+            return
+
+        rec = instrument._active
+        if rec is None:
+            self.__sort()
         else:
-            self._blocks = sorted(
-                self._blocks, reverse = self.reverse,
-                key=lambda b: b.address())
+            with rec.phase("sort"):
+                self.__sort()
+            rec.count("group_sorts")
+
+    def __sort(self) -> None:
+        keys = self.__keys
+        sortby = self.__sort_key
+        for block in self._blocks:
+            if block not in keys:
+                keys[block] = sortby(block)
+
+        self._blocks.sort(key = keys.__getitem__, reverse = self.__reverse)
+        self._sorted = True
+
+    def name(self) -> str:
+        return self._name
+
+    def desc(self) -> Any:
+        return self._desc
+
+    def options(self) -> dict:
+        """
+        Functions given by the creator, None means the default behavior.
+        """
+        return dict(checker = self.__checker, sortby = self.__sortby)
 
     def _check(self, block: Block) -> bool:
         if self.__checker:
@@ -298,18 +877,17 @@ class Group():
 
     @classmethod
     def check_duplicated_name(cls, *groups):
-        blocks = list()
-        for group in groups:
-            blocks.extend(group.dump())
-
-        cls.check_duplicated("block name", lambda b: b.name(), blocks)
-        cls.check_duplicated("block address", lambda b: b.address(), blocks)
-
-        fields = list()
-        for block in blocks:
-            fields.extend(block.dump())
+        """
+        Print duplicated block names, block addresses and field names, and
+        return the findings.
 
-        cls.check_duplicated("field name", lambda f: f.name, fields)
+        Link to: class Validator
+        """
+        err = "Duplicated Error {desc}: \n\t1. {o1}\n\t. {o2}"
+        findings = Validator(*groups).run()
+        for f in findings:
+            cls.print_error(err.format(desc = f.kind, o1 = f.second, o2 = f.first))
+        return findings
 
 
 class GeneratorBase():
@@ -337,13 +915,74 @@ class ParserBase():
         self._bcreator = bcreator or Block.BlockCreator()
 
         self._last_block = None
+        # address -> Block, filled by _add_field() and _get_block()
+        self._block_index = dict()
 
         self._is_parsed = False
+        # the task of gen_group_async() while parsing
+        self._parsing = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_parsing"] = None
+        return state
 
     def gen_group(self):
+        """
+        Parse once and return the group. The parser is marked parsed only
+        after _parser() returns, so a failed parsing raises again instead of
+        returning a partial group. Sources are parsed into the same group
+        though, so create a new parser to parse them again, like Watcher.
+        """
         if not self._is_parsed:
+            rec = instrument._active
+            if rec is None:
+                self._parser()
+            else:
+                with rec.phase("parse"):
+                    self._parser()
+                rec.count("fields",
+                    sum(len(b._fields) for b in self._group._blocks))
             self._is_parsed = True
-            self._parser()
+        return self._group
+
+    async def gen_group_async(self, executor: Optional[Executor] = None):
+        """
+        gen_group() in `executor`, the default executor of the loop (threads)
+        if it is None, so reading sources doesn't block the loop. Concurrent
+        calls share one parsing.
+
+        With a ProcessPoolExecutor, the parser is pickled to a worker and the
+        parsed copy is pickled back, so the parser must be picklable, e.g. no
+        lambdas in BlockCreator. Blocks get functions of the creator again.
+
+        Link to: gather_groups()
+        """
+        task = self._parsing
+        if task is None:
+            if self._is_parsed:
+                return self._group
+            task = self._parsing = asyncio.ensure_future(
+                self.__parse_in(executor))
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._parsing = None
+
+    async def __parse_in(self, executor) -> 'Group':
+        loop = asyncio.get_running_loop()
+        if isinstance(executor, ProcessPoolExecutor):
+            parsed = await loop.run_in_executor(
+                executor, _parse_in_process, self)
+            parsed._parsing = self._parsing
+            parsed._bcreator = self._bcreator
+            self.__dict__.update(parsed.__dict__)
+            # pickled blocks lost functions of the creator.
+            for block in self._group._blocks:
+                self._bcreator.bind(block)
+        else:
+            await loop.run_in_executor(executor, self.gen_group)
         return self._group
 
     def __create_new_block(self, addr):
@@ -355,6 +994,23 @@ class ParserBase():
         bname = self._find_block_name(addr)
         block = self._bcreator.create(bname, addr)
         self._group.add_block(block)
+        self._block_index[addr] = block
+
+        rec = instrument._active
+        if rec is not None:
+            rec.count("blocks_created")
+        return block
+
+    def _get_block(self, addr, create = True) -> Optional[Block]:
+        """
+        Return the block with the address, the block is created if it is
+        the first time to see the address and `create` is True.
+
+        Link to: _add_field()
+        """
+        block = self._block_index.get(addr, None)
+        if block is None and create:
+            block = self.__create_new_block(addr)
         return block
 
     def _find_block_name(self, addr) -> str:
@@ -369,10 +1025,10 @@ class ParserBase():
     def _add_field(self, field):
         """
         You only need to add field without considering errands with block
-        and group. The group switches to next and add block when adress is
-        changed.
+        and group. The group switches to the block of the address when
+        adress is changed, fields can be added in any order.
 
-        Link to: _find_block_name()
+        Link to: _find_block_name(), _get_block()
         """
         block = self._last_block
         if block is not None:
@@ -382,10 +1038,10 @@ class ParserBase():
                 """
                 find next block
                 """
-                block = self.__create_new_block(field.addr)
+                block = self._get_block(field.addr)
                 block.add_field(field)
         else:
-            block = self.__create_new_block(field.addr)
+            block = self._get_block(field.addr)
             block.add_field(field)
 
         self._last_block = block
@@ -409,16 +1065,28 @@ class ParserBase():
         """
         raise NotImplementedError
 
+
+def _parse_in_process(parser: ParserBase) -> ParserBase:
+    parser.gen_group()
+    return parser
+
+
 class ParserWithNameDict(ParserBase):
     def __init__(self, *arg, **kw):
         super().__init__(*arg, **kw)
         self._name_dict = dict()
 
     def _register_block_name(self, addr: Any, name: str) -> None:
-        if self._name_dict.get(addr, None) is not None:
+        """
+        The same address can be registered again with the same name, e.g.
+        a block is revisited in merged sources.
+        """
+        name = name.strip()
+        ori = self._name_dict.get(addr, None)
+        if ori is not None and ori != name:
             raise ValueError(
                 "Duplicated block address input: {}, {}".format(addr, name))
-        self._name_dict[addr] = name.strip()
+        self._name_dict[addr] = name
 
     def _find_block_name(self, addr: Any):
         name = self._name_dict.get(addr, None)
@@ -0,0 +1,303 @@
+import sys
+from typing import Callable, Dict, Optional
+
+from .core import Block, Group
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Vectorized decoder of register dumps, it requires NumPy.
+
+    decoder = DumpDecoder(group)
+
+    # address/value traces: bytes, mmap, or NumPy arrays
+    res = decoder.decode_trace(data, addr_dtype = "<u4", value_dtype = "<u4")
+    res["CTRL"]["index"]        # positions of samples of block CTRL
+    res["CTRL"]["en"]           # values of field en in those samples
+
+    # raw memory images, one or more images of the same size
+    res = decoder.decode_image(image, base = 0x1000, value_dtype = "<u4")
+    res["CTRL"]["en"]           # a value, or a column per image
+
+Addresses of samples are matched with searchsorted on the sorted addresses
+of blocks (or a direct table when addresses are dense), then samples are
+grouped by block with one sort per chunk, and every field is extracted by
+shift and mask on the whole column of the block.
+
+Blocks are matched by `addr_key(block)`, which must be an int. The default
+is the address of int-addressed blocks; give addr_key for tuple addresses,
+e.g. `lambda b: (b._addr[0] << 16) | b._addr[1]` for a trace recording the
+device in the high half of addresses.
+"""
+
+AddrKeyType = Callable[[Block], int]
+
+_LITTLE = sys.byteorder == "little"
+
+# samples decoded at a time, to bound memory of the temporary arrays
+CHUNK = 1 << 24
+
+# addresses are looked up in a direct table when the span of addresses is
+# at most LUT_SPAN, or LUT_RATIO times the number of blocks.
+LUT_SPAN = 1 << 16
+LUT_RATIO = 16
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError(
+            "DumpDecoder requires NumPy, install it with `pip install numpy`")
+
+
+def _field_dtype(bits):
+    for size in (1, 2, 4, 8):
+        if bits <= size * 8:
+            return np.dtype("u{}".format(size))
+    raise ValueError("Fields wider than 64 bits are unsupported")
+
+
+def _unsigned(values):
+    """
+    View of values in the unsigned dtype of the same width, so masks of full
+    width fields fit in it and shifts don't extend signs.
+    """
+    if values.dtype.kind == "u":
+        return values
+    return values.view(values.dtype.str.replace("i", "u"))
+
+
+def _clip(shift, mask, width):
+    """
+    Clip the mask to the bits of values, so it fits in their dtype.
+    """
+    if shift >= width:
+        return 0, 0
+    return shift, mask & ((1 << (width - shift)) - 1)
+
+
+def _default_key(block: Block) -> int:
+    addr = block._addr
+    if type(addr) is not int:
+        raise ValueError(
+            "Block {} has a non-int address {!r}, give addr_key to "
+            "DumpDecoder".format(block.name(), addr))
+    return addr
+
+
+class DumpDecoder():
+    """
+    The group is indexed once, so one decoder can decode many dumps.
+    """
+    class AddressDuplicated(ValueError): pass
+
+    def __init__(self, group: Group, addr_key: Optional[AddrKeyType] = None):
+        _require_numpy()
+        addr_key = addr_key or _default_key
+
+        self._blocks = group.dump()
+        self._layouts = list()
+        for block in self._blocks:
+            self._layouts.append([
+                (f.name, f.shift, (1 << f.bits) - 1, _field_dtype(f.bits))
+                for f in block.dump()])
+
+        keys = np.array([addr_key(b) for b in self._blocks], dtype = np.uint64)
+        order = np.argsort(keys, kind = "stable")
+        self._keys = keys[order]
+        self._order = order.astype(np.intp)
+
+        dup = np.flatnonzero(self._keys[1:] == self._keys[:-1])
+        if len(dup):
+            a = self._blocks[self._order[dup[0]]]
+            b = self._blocks[self._order[dup[0] + 1]]
+            raise self.AddressDuplicated(
+                "Blocks {} and {} have the same address key 0x{:x}".format(
+                    a.name(), b.name(), int(self._keys[dup[0]])))
+
+        # Samples are tagged by the index of block + 1, 0 for unmatched ones.
+        # Tags fitting in 16 bits are grouped with radix sort.
+        self._id_dtype = np.dtype(
+            np.uint16 if len(self._blocks) < 0xffff else np.int64)
+        self._ids = (self._order + 1).astype(self._id_dtype)
+
+        # a direct table of tags, indexed by address - low, and the last one
+        # is 0 for addresses out of range.
+        self._lut = None
+        if len(self._keys):
+            self._low = int(self._keys[0])
+            span = int(self._keys[-1]) - self._low + 1
+            if span <= max(LUT_SPAN, LUT_RATIO * len(self._keys)):
+                self._lut = np.zeros(span + 1, dtype = self._id_dtype)
+                self._lut[self._keys - np.uint64(self._low)] = self._ids
+
+    def _tags(self, addrs) -> "np.ndarray":
+        addrs = np.asarray(addrs)
+        if not len(self._keys):
+            return np.zeros(len(addrs), dtype = self._id_dtype)
+
+        if self._lut is not None:
+            span = len(self._lut) - 1
+            if addrs.dtype.kind != "u" or \
+                    np.iinfo(addrs.dtype).max < int(self._keys[-1]):
+                addrs = addrs.astype(np.uint64)
+            # addresses below low wrap around to large offsets.
+            off = addrs - addrs.dtype.type(self._low)
+            np.minimum(off, span, out = off)
+            return self._lut[off]
+
+        addrs = addrs.astype(np.uint64, copy = False)
+        pos = np.searchsorted(self._keys, addrs)
+        np.minimum(pos, len(self._keys) - 1, out = pos)
+        return np.where(self._keys[pos] == addrs, self._ids[pos], 0)
+
+    def match(self, addrs) -> "np.ndarray":
+        """
+        @output index of the block of every address in group.dump(), -1 for
+            addresses not in the group.
+        """
+        return self._tags(addrs).astype(np.intp) - 1
+
+    def _fields(self, bi, values, index, structured):
+        layout = self._layouts[bi]
+        if structured:
+            res = np.empty(len(values), dtype = [("index", np.int64)] +
+                           [(name, dtype) for name, _, _, dtype in layout])
+            res["index"] = index
+        else:
+            res = dict(index = index)
+
+        values = _unsigned(values)
+        t = values.dtype.type
+        width = values.dtype.itemsize * 8
+        for name, shift, mask, dtype in layout:
+            shift, mask = _clip(shift, mask, width)
+            col = values >> t(shift) if shift else values
+            res[name] = (col & t(mask)).astype(dtype)
+        return res
+
+    @staticmethod
+    def _trace_columns(data, addr_dtype, value_dtype):
+        if isinstance(data, tuple):
+            addrs, values = data
+            return np.asarray(addrs), np.asarray(values)
+
+        if isinstance(data, np.ndarray) and data.dtype.names:
+            return data["addr"], data["value"]
+        if isinstance(data, np.ndarray) and data.ndim == 2:
+            return data[:, 0], data[:, 1]
+
+        dtype = np.dtype([("addr", addr_dtype), ("value", value_dtype)])
+        records = np.frombuffer(data, dtype = dtype,
+                                count = len(data) // dtype.itemsize)
+        return records["addr"], records["value"]
+
+    def decode_trace(self, data, addr_dtype = "<u4", value_dtype = "<u4",
+            structured: bool = False) -> Dict[str, dict]:
+        """
+        @input data: packed (addr, value) records as bytes, mmap or other
+            buffers; a structured array with "addr" and "value"; an array of
+            shape (n, 2); or a tuple of address and value arrays.
+        @input structured: return a structured array for every block instead
+            of a dict of columns.
+        @output block name -> columns, only blocks found in the trace.
+            "index" is the position of samples in the trace.
+        """
+        addrs, values = self._trace_columns(data, addr_dtype, value_dtype)
+        if len(addrs) != len(values):
+            raise ValueError("Addresses and values have different lengths")
+        if values.dtype.kind not in "ui":
+            raise ValueError("Values must be integers: {}".format(values.dtype))
+        values = values.astype(values.dtype.newbyteorder("="), copy = False)
+
+        # every chunk is sorted by tags, so samples of a block are a slice.
+        # Keys are (tag << 32 | position), sorting them is much faster than a
+        # stable argsort of tags, and positions keep the order of samples.
+        chunks = list()
+        found = np.zeros(len(self._blocks) + 1, dtype = bool)
+        for start in range(0, len(addrs), CHUNK):
+            tags = self._tags(addrs[start:start + CHUNK])
+            counts = np.bincount(tags, minlength = len(self._blocks) + 1)
+            bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+
+            keys = tags.astype(np.uint64)
+            keys <<= np.uint64(32)
+            keys |= np.arange(len(tags), dtype = np.uint64)
+            keys.sort()
+            # the low halves of keys are positions
+            order = keys.view(np.uint32)[0 if _LITTLE else 1::2]
+
+            chunks.append((bounds,
+                           np.add(order, start, dtype = np.int64),
+                           values[start:start + CHUNK][order]))
+            del keys, order
+            found |= counts.astype(bool)
+
+        res = dict()
+        for bi in np.flatnonzero(found[1:]).tolist():
+            parts = [(index[bounds[bi + 1]:bounds[bi + 2]],
+                      vals[bounds[bi + 1]:bounds[bi + 2]])
+                     for bounds, index, vals in chunks]
+            if len(parts) == 1:
+                index, vals = parts[0]
+            else:
+                index = np.concatenate([p[0] for p in parts])
+                vals = np.concatenate([p[1] for p in parts])
+            res[self._blocks[bi].name()] = self._fields(
+                bi, vals, index, structured)
+        return res
+
+    def decode_image(self, image, base: int = 0, value_dtype = "<u4",
+            step: Optional[int] = None, count: Optional[int] = None
+            ) -> Dict[str, dict]:
+        """
+        The register at `base + i * step` is the word i of the image.
+
+        @input image: bytes, mmap or other buffers of one or more images, or
+            an array of words of shape (words, ) or (images, words).
+        @input step: address step of words, the size of value_dtype by
+            default.
+        @input count: number of images in the buffer, 1 by default.
+        @output block name -> field name -> value or column of all images,
+            only blocks inside the image.
+        """
+        if isinstance(image, np.ndarray):
+            words = image
+        else:
+            words = np.frombuffer(image, dtype = value_dtype)
+        if count is not None:
+            words = words.reshape(count, -1)
+        step = step or words.dtype.itemsize
+        nwords = words.shape[-1]
+
+        offset = self._keys.astype(np.int64) - base
+        inside = (offset >= 0) & (offset % step == 0) & \
+            (offset // step < nwords)
+        word_idx = offset[inside] // step
+        blocks = self._order[inside]
+        values = words[..., word_idx]
+        values = _unsigned(
+            values.astype(values.dtype.newbyteorder("="), copy = False))
+
+        # fields of all blocks are flattened, so each is extracted once.
+        width = values.dtype.itemsize * 8
+        f_col, f_shift, f_mask, f_names = list(), list(), list(), list()
+        for col, bi in enumerate(blocks.tolist()):
+            for name, shift, mask, _ in self._layouts[bi]:
+                shift, mask = _clip(shift, mask, width)
+                f_col.append(col)
+                f_shift.append(shift)
+                f_mask.append(mask)
+                f_names.append((bi, name))
+
+        fields = values[..., np.array(f_col, dtype = np.intp)]
+        fields >>= np.array(f_shift, dtype = values.dtype)
+        fields &= np.array(f_mask, dtype = values.dtype)
+
+        res = dict()
+        for i, (bi, name) in enumerate(f_names):
+            block = res.setdefault(self._blocks[bi].name(), dict())
+            block[name] = fields.T[i]
+        return res
@@ -1,9 +1,32 @@
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+from . import instrument
 from .core import Field, Block, Group, GeneratorBase
+from .cache import RenderCache
+from .phash import PerfectHash, SALT
+from .template import compile_template, render_template
+
+
+def _render_chunk(create_union, blocks):
+    """
+    Worker of CGeneratorBase in parallel mode.
+    """
+    return [create_union(b).generate() for b in blocks]
+
 
 class CUnionBase():
     """
     Union size: 16bits
     Endianness: littel-endian
+
+    TEMPLETE_* are str.format() templates, they are compiled into render
+    functions on first use, so subclasses can override them as usual.
+
+    Link to: compile_template()
     """
 
     C_TYPE_FIELDS = "uint32_t"
@@ -26,25 +49,36 @@ class CUnionBase():
     ])
 
     TEMPLETE_ATTRITUBE = "\t\t{c_type} {name}:{bits};\t/*{comment}*/"
+
+    TEMPLETE_COMMENT = "/* block: {name}({addr}) */"
+
+    MAX_BITS = 16
+
     def __init__(self, block: Block):
-        # TODO: extract to an arg
-        self._max_bits = 16
+        self._max_bits = self.MAX_BITS
 
         self._block = block
 
     def generate(self):
-        comment = self._gen_comment()
-        struct = self._gen_structure()
-        setter = self._gen_setter()
-        getter = self._gen_getter()
+        return "".join(self.generate_iter())
 
-        return "\n".join([comment, struct, setter, getter])
+    def generate_iter(self):
+        """
+        Yield the code in chunks, "".join() of chunks equals generate().
+        """
+        yield self._gen_comment()
+        yield "\n"
+        yield self._gen_structure()
+        yield "\n"
+        yield self._gen_setter()
+        yield "\n"
+        yield self._gen_getter()
 
     def name(self):
-        return self.TEMPLETE_NAME.format(block_name = self._block.name())
+        return render_template(self.TEMPLETE_NAME, block_name = self._block.name())
 
     def raw_name(self):
-        return self.TEMPLETE_RAW_NAME.format(block_name = self._block.name())
+        return render_template(self.TEMPLETE_RAW_NAME, block_name = self._block.name())
 
     def _gen_setter(self) -> str:
         """
@@ -59,7 +93,7 @@ class CUnionBase():
         return "/* NotImplemented Block Getter */"
 
     def _gen_comment(self) -> str:
-        return "/* block: {name}({addr}) */".format(
+        return render_template(self.TEMPLETE_COMMENT,
             name = self._block.name(),
             addr = self._block.address()
         )
@@ -68,17 +102,17 @@ class CUnionBase():
         name = self._block.name()
         struct = self.__pack_block()
 
-        return self.TEMPLETE_TYPEDEF.format(
+        return render_template(self.TEMPLETE_TYPEDEF,
             name = self.name(),
             raw_name = self.raw_name(),
             struct = struct
         )
 
     def __pack_block(self):
-        atmpl = self.TEMPLETE_ATTRITUBE
+        atmpl = compile_template(self.TEMPLETE_ATTRITUBE)
         def new_field(field):
             comment = field.range()
-            return atmpl.format(
+            return atmpl(
                 c_type = self.C_TYPE_FIELDS,
                 name = field.name,
                 bits = field.bits,
@@ -88,7 +122,7 @@ class CUnionBase():
         def unused_field(idx, bits, shift):
             comment = Field.cal_range(bits, shift)
             name = "unused{}".format(idx)
-            return atmpl.format(
+            return atmpl(
                 c_type = self.C_TYPE_FIELDS,
                 name = name,
                 bits = bits,
@@ -126,8 +160,8 @@ class CUnionBase():
             last_shift = f.shift + f.bits
 
         if total_bits > self._max_bits:
-            raise Exception(
-                "The block:{} has too many bits".fromat(self._block.name))
+            raise ValueError(
+                "The block:{} has too many bits".format(self._block.name()))
         elif total_bits < self._max_bits:
             # fill the reset of bits
             bits = self._max_bits - total_bits
@@ -137,7 +171,7 @@ class CUnionBase():
 
         attrs = "\n".join(attrs)
 
-        return self.TEMPLETE_UNION.format(
+        return render_template(self.TEMPLETE_UNION,
             attrs = attrs,
             c_type = self.C_TYPE_FIELDS
         )
@@ -148,24 +182,732 @@ class CUnionRaw(CUnionBase):
     def _gen_getter(self): return ""
 
 
+class CUnionAccessor(CUnionBase):
+    """
+    A getter and a setter for every field, the register is accessed by
+    TEMPLETE_REG_READ and TEMPLETE_REG_WRITE, e.g. extern functions:
+
+        extern void reg_write(uint16_t addr, uint32_t val);
+        extern uint32_t reg_read(uint16_t addr);
+
+    Every setter reads, modifies and writes the register once.
+
+    Templates of register access get `addr` (Block.address()) and `raw`
+    (the address given by the parser), e.g. "pread({raw[0]}, {raw[1]})" for
+    tuple addresses.
+    """
+    TEMPLETE_REG_READ = "reg_read({addr})"
+
+    TEMPLETE_REG_WRITE = "reg_write({addr}, {val})"
+
+    TEMPLETE_GETTER = (
+"""
+static inline uint32_t get_{field}(void)
+{{
+	{uname} reg = ({uname}){read};
+	return reg.{field};
+}}
+""")
+
+    TEMPLETE_SETTER = (
+"""
+static inline void set_{field}(uint32_t val)
+{{
+	{uname} reg = ({uname}){read};
+	reg.{field} = val;
+	{write};
+}}
+""")
+
+    def _reg_read(self) -> str:
+        return render_template(self.TEMPLETE_REG_READ,
+            addr = self._block.address(), raw = self._block._addr)
+
+    def _reg_write(self, val: str) -> str:
+        return render_template(self.TEMPLETE_REG_WRITE,
+            addr = self._block.address(), raw = self._block._addr, val = val)
+
+    def _gen_accessor(self, templete) -> str:
+        render = compile_template(templete)
+        read = self._reg_read()
+        write = self._reg_write("reg.val")
+        uname = self.name()
+        addr = self._block.address()
+
+        return "\n".join(
+            render(field = f.name, addr = addr, uname = uname,
+                   read = read, write = write)
+            for f in self._block.dump())
+
+    def _gen_setter(self):
+        return self._gen_accessor(self.TEMPLETE_SETTER)
+
+    def _gen_getter(self):
+        return self._gen_accessor(self.TEMPLETE_GETTER)
+
+
+class CUnionBatch(CUnionAccessor):
+    """
+    Besides the accessors, update_<block>() writes any subset of fields with
+    a single read-modify-write. Fields are selected by OR of their masks:
+
+        update_CTRL(MSK_CTRL_en | MSK_CTRL_mode,
+                    (R_CTRL){ .en = 1, .mode = 3 });
+
+    When all fields are selected, the register is written without reading
+    it, and bits not belonging to any field are written as 0. The mask is
+    usually a constant, so the compiler drops the unused branch.
+    """
+    TEMPLETE_FIELD_MASK = "#define MSK_{block}_{field}\t0x{mask:x}u"
+
+    TEMPLETE_ALL_MASK = "#define MSK_{block}_ALL\t0x{mask:x}u"
+
+    TEMPLETE_UPDATE = (
+"""
+static inline void update_{block}({c_type} mask, {uname} val)
+{{
+	{uname} reg;
+
+	mask &= {all};
+	if (mask == {all}) {{
+		reg.val = val.val & {all};
+	}} else {{
+		reg = ({uname}){read};
+		reg.val = (reg.val & ~mask) | (val.val & mask);
+	}}
+	{write};
+}}
+""")
+
+    def _gen_masks(self) -> str:
+        block = self._block.name()
+        render = compile_template(self.TEMPLETE_FIELD_MASK)
+        codes = [render(block = block, field = f.name, mask = f.bitmask)
+                 for f in self._block.dump()]
+        codes.append(render_template(self.TEMPLETE_ALL_MASK,
+            block = block, mask = self._block.occupied()))
+        return "\n".join(codes)
+
+    def _gen_update(self) -> str:
+        block = self._block.name()
+        return render_template(self.TEMPLETE_UPDATE,
+            block = block,
+            uname = self.name(),
+            c_type = self.C_TYPE_FIELDS,
+            all = "MSK_{}_ALL".format(block),
+            read = self._reg_read(),
+            write = self._reg_write("reg.val"),
+        )
+
+    def _gen_setter(self):
+        return "\n".join([
+            super()._gen_setter(),
+            self._gen_masks(),
+            self._gen_update(),
+        ])
+
+
+class CUnionShadow(CUnionBatch):
+    """
+    Registers are cached in a shadow copy, for registers which are slow to
+    read or write-only:
+    - getters read the shadow, there is no bus access;
+    - setters and update_<block>() modify the shadow and write it through;
+    - sync_<block>() reads the register into the shadow;
+    - flush_<block>() writes the shadow to the register.
+
+    Shadows start with defaults of fields. Never sync write-only registers.
+
+    Shadows are declared extern, define the SHADOW_IMPL macro
+    (REG_SHADOW_IMPL) in one source file before including the header to
+    define them.
+
+    Link to: CShadowGenerator
+    """
+    SHADOW_IMPL = "REG_SHADOW_IMPL"
+
+    TEMPLETE_SHADOW_NAME = "shadow_{block}"
+
+    TEMPLETE_SHADOW = "\n".join([
+        "#ifdef {impl}",
+        "{uname} {shadow} = {{ .val = 0x{default:x} }};",
+        "#else",
+        "extern {uname} {shadow};",
+        "#endif",
+    ])
+
+    TEMPLETE_GETTER = (
+"""
+static inline uint32_t get_{field}(void)
+{{
+	return {shadow}.{field};
+}}
+""")
+
+    TEMPLETE_SETTER = (
+"""
+static inline void set_{field}(uint32_t val)
+{{
+	{shadow}.{field} = val;
+	{write};
+}}
+""")
+
+    TEMPLETE_UPDATE = (
+"""
+static inline void update_{block}({c_type} mask, {uname} val)
+{{
+	mask &= {all};
+	{shadow}.val = ({shadow}.val & ~mask) | (val.val & mask);
+	{write};
+}}
+""")
+
+    TEMPLETE_SYNC = (
+"""
+static inline void sync_{block}(void)
+{{
+	{shadow}.val = {read};
+}}
+
+static inline void flush_{block}(void)
+{{
+	{write};
+}}
+""")
+
+    def shadow_name(self) -> str:
+        return render_template(self.TEMPLETE_SHADOW_NAME,
+            block = self._block.name())
+
+    def default(self) -> int:
+        """
+        Value of the register with defaults of fields.
+        """
+        val = 0
+        for f in self._block.dump():
+            if type(f.default) is int:
+                val |= (f.default << f.shift) & f.bitmask
+        return val
+
+    def _write_shadow(self) -> str:
+        return self._reg_write(self.shadow_name() + ".val")
+
+    def _gen_accessor(self, templete) -> str:
+        render = compile_template(templete)
+        shadow = self.shadow_name()
+        write = self._write_shadow()
+
+        return "\n".join(
+            render(field = f.name, shadow = shadow, write = write)
+            for f in self._block.dump())
+
+    def _gen_shadow(self) -> str:
+        return render_template(self.TEMPLETE_SHADOW,
+            impl = self.SHADOW_IMPL,
+            uname = self.name(),
+            shadow = self.shadow_name(),
+            default = self.default(),
+        )
+
+    def _gen_update(self) -> str:
+        block = self._block.name()
+        return render_template(self.TEMPLETE_UPDATE,
+            block = block,
+            uname = self.name(),
+            shadow = self.shadow_name(),
+            c_type = self.C_TYPE_FIELDS,
+            all = "MSK_{}_ALL".format(block),
+            write = self._write_shadow(),
+        )
+
+    def _gen_sync(self) -> str:
+        return render_template(self.TEMPLETE_SYNC,
+            block = self._block.name(),
+            shadow = self.shadow_name(),
+            read = self._reg_read(),
+            write = self._write_shadow(),
+        )
+
+    def _gen_setter(self):
+        return "\n".join([
+            self._gen_shadow(),
+            self._gen_sync(),
+            super()._gen_setter(),
+        ])
+
+
+def c_identifier(group: Group) -> str:
+    """
+    Name of the group used in C identifiers, e.g. sync_<group>().
+    CsvBulkParser names groups by their csv paths unless `gname` is given.
+    """
+    name = group.name()
+    if not (isinstance(name, str) and name.isascii() and name.isidentifier()):
+        raise ValueError(
+            "Group name {!r} isn't a C identifier, give the parser a gname "
+            "like \"Bus\"".format(name))
+    return name
+
+
+class CDescriptors():
+    """
+    Constant descriptor tables of blocks and fields of a group, looked up by
+    name in O(1) with minimal perfect hashes, no heap is used:
+
+        const struct Bus_field_desc *f = Bus_field_find("dev0_stop");
+        const struct Bus_block_desc *b = &Bus_blocks[f->block];
+
+    Blocks have their address given by parser, tuple addresses are stored
+    as arrays, e.g. { 1, 0x2 }. Names of fields must be unique in the
+    group, see Validator.
+
+    Link to: class PerfectHash
+    """
+    TEMPLETE_COMMON = "\n".join([
+        "#ifndef FP_DESCRIPTOR_COMMON",
+        "#define FP_DESCRIPTOR_COMMON",
+        "#include <stdint.h>",
+        "#include <string.h>",
+        "",
+        "static inline uint32_t fp_fnv1a(const char *s, uint32_t seed)",
+        "{{",
+        "\tuint32_t h = 0x811c9dc5u ^ seed;",
+        "",
+        "\twhile (*s) {{",
+        "\t\th ^= (uint8_t)*s++;",
+        "\t\th *= 0x01000193u;",
+        "\t}}",
+        "\treturn h;",
+        "}}",
+        "#endif /* FP_DESCRIPTOR_COMMON */",
+    ])
+
+    TEMPLETE_TYPES = "\n".join([
+        "struct {group}_block_desc {{",
+        "\tconst char *name;",
+        "\t{addr_type} addr[{addr_words}];",
+        "}};",
+        "",
+        "struct {group}_field_desc {{",
+        "\tconst char *name;",
+        "\tuint32_t block;\t/* index of {group}_blocks */",
+        "\tuint8_t shift;",
+        "\tuint8_t width;",
+        "\t{mask_type} mask;",
+        "}};",
+    ])
+
+    TEMPLETE_TABLE = "\n".join([
+        "static const int32_t {group}_{kind}_disp[{nbuckets}] = {{",
+        "{disp}",
+        "}};",
+        "",
+        "static const struct {group}_{kind}_desc {group}_{kind}s[{count}] = {{",
+        "{rows}",
+        "}};",
+        "",
+        "static inline const struct {group}_{kind}_desc *",
+        "{group}_{kind}_find(const char *name)",
+        "{{",
+        "\tint32_t d = {group}_{kind}_disp[fp_fnv1a(name, 0) % {nbuckets}u];",
+        "\tuint32_t i = d < 0 ? (uint32_t)(-d - 1) :",
+        "\t\t(fp_fnv1a(name, 0x{salt:x}u) ^ (uint32_t)d) % {count}u;",
+        "",
+        "\treturn strcmp({group}_{kind}s[i].name, name) ? 0 : &{group}_{kind}s[i];",
+        "}}",
+    ])
+
+    TEMPLETE_BLOCK_ROW = "\t{{ {name}, {{ {addr} }} }},"
+
+    TEMPLETE_FIELD_ROW = "\t{{ {name}, {block}, {shift}, {width}, 0x{mask:x}u }},"
+
+    def __init__(self, group: Group, blocks: Sequence[Block]):
+        self._group = group
+        self._blocks = blocks
+
+    @staticmethod
+    def c_string(s: str) -> str:
+        """
+        A C string literal, non-printable and non-ascii bytes are escaped
+        in octal.
+        """
+        out = list()
+        for b in s.encode():
+            c = chr(b)
+            if c in "\\\"":
+                out.append("\\" + c)
+            elif 0x20 <= b < 0x7f:
+                out.append(c)
+            else:
+                out.append("\\{:03o}".format(b))
+        return "\"" + "".join(out) + "\""
+
+    @staticmethod
+    def _addr_words(addr) -> list:
+        if type(addr) is tuple:
+            return list(addr)
+        return [addr]
+
+    def _table(self, kind, phash, rows, **kw) -> str:
+        disp = ", ".join(str(d) for d in phash.disp)
+        return render_template(self.TEMPLETE_TABLE,
+            kind = kind,
+            nbuckets = len(phash.disp),
+            count = len(phash.slots),
+            salt = SALT,
+            disp = "\t" + disp,
+            rows = "\n".join(rows[i] for i in phash.slots),
+            **kw)
+
+    def generate(self) -> str:
+        blocks = self._blocks
+        fields = [(bi, f) for bi, b in enumerate(blocks) for f in b.dump()]
+        if not fields:
+            return ""
+
+        group = c_identifier(self._group)
+        addrs = [self._addr_words(b._addr) for b in blocks]
+        if not all(type(a) is int and a >= 0 for words in addrs for a in words):
+            raise ValueError(
+                "Addresses of group {} must be ints or tuples of ints".format(
+                    group))
+        addr_words = max(len(a) for a in addrs)
+        big_addr = any(a >> 32 for words in addrs for a in words)
+        big_mask = any(f.bitmask >> 32 for _, f in fields)
+
+        try:
+            block_hash = PerfectHash([b.name() for b in blocks])
+            field_hash = PerfectHash([f.name for _, f in fields])
+        except PerfectHash.KeyDuplicated as e:
+            raise PerfectHash.KeyDuplicated(
+                "{} in group {}, check the group with Validator".format(
+                    e, group)) from None
+        # fields refer to blocks by their slots
+        block_slot = {bi: slot for slot, bi in enumerate(block_hash.slots)}
+
+        brow = compile_template(self.TEMPLETE_BLOCK_ROW)
+        block_rows = [
+            brow(name = self.c_string(b.name()),
+                 addr = ", ".join("0x{:x}".format(a) for a in words))
+            for b, words in zip(blocks, addrs)]
+
+        frow = compile_template(self.TEMPLETE_FIELD_ROW)
+        field_rows = [
+            frow(name = self.c_string(f.name), block = block_slot[bi],
+                 shift = f.shift, width = f.bits, mask = f.bitmask)
+            for bi, f in fields]
+
+        return "\n\n".join([
+            render_template(self.TEMPLETE_COMMON),
+            render_template(self.TEMPLETE_TYPES,
+                group = group,
+                addr_type = "uint64_t" if big_addr else "uint32_t",
+                addr_words = addr_words,
+                mask_type = "uint64_t" if big_mask else "uint32_t"),
+            self._table("block", block_hash, block_rows, group = group),
+            self._table("field", field_hash, field_rows, group = group),
+        ])
+
+
 class CGeneratorBase(GeneratorBase):
-    def __init__(self, group: Group, create_union = None):
+    """
+    With `burst`, runs of blocks at consecutive addresses, `step` apart,
+    get bank functions, which save or restore the whole run in one
+    transfer:
+
+        static inline void bank_load_CONFIG0(uint16_t buf[6]);
+        static inline void bank_store_CONFIG0(const uint16_t buf[6]);
+
+    By default the transfer is a volatile access of C_TYPE_FIELDS at every
+    address from the address of the first block, like accessors of single
+    registers, `*(volatile uint32_t *)0x1004`. So for byte-addressed 32-bit
+    registers, step is 4. Override TEMPLETE_BURST_READ/WRITE for other
+    buses, e.g. "\tpread_burst({raw[0]}, {raw[1]}, buf, {count});" for
+    peripherals, `raw` is the address of the first block given by parser.
+    Without overriding them, runs of blocks whose address() isn't an int
+    raise ValueError.
+
+    With `descriptors`, descriptor tables of blocks and fields are generated
+    after blocks, see CDescriptors.
+    """
+    MIN_RUN = 2
+
+    # chunks in flight per process in parallel mode
+    WINDOW = 2
+
+    STEP = 1
+
+    DESCRIPTORS = CDescriptors
+
+    TEMPLETE_BANK = (
+"""
+#define BANK_{name}_SIZE	{count}
+
+static inline void bank_load_{name}({c_type} buf[{count}])
+{{
+{read}
+}}
+
+static inline void bank_store_{name}(const {c_type} buf[{count}])
+{{
+{write}
+}}
+""")
+
+    TEMPLETE_BURST_READ = "\n".join([
+        "\tfor (int i = 0; i < {count}; i++)",
+        "\t\tbuf[i] = *((const volatile {c_type} *)",
+        "\t\t\t(uintptr_t)({addr} + i * {step}));",
+    ])
+
+    TEMPLETE_BURST_WRITE = "\n".join([
+        "\tfor (int i = 0; i < {count}; i++)",
+        "\t\t*((volatile {c_type} *)",
+        "\t\t\t(uintptr_t)({addr} + i * {step})) = buf[i];",
+    ])
+
+    def __init__(self, group: Group, create_union = None,
+            jobs: Optional[int] = None, chunksize: int = 64,
+            cache: Optional[RenderCache] = None, burst: bool = False,
+            descriptors: bool = False, step: Optional[int] = None):
+        """
+        @input jobs: render blocks in `jobs` processes, 0 means the number of
+            CPUs, None means rendering in this process.
+            `create_union` must be picklable in parallel mode, e.g. a class
+            or a function defined at module level, or a functools.partial.
+        @input chunksize: number of blocks sent to a process at once.
+        @input cache: reuse codes of unchanged blocks from the cache, only
+            the others are rendered.
+        @input burst: generate bank functions of runs of blocks.
+        @input step: difference of addresses of consecutive registers in
+            runs, STEP by default.
+        @input descriptors: generate descriptor tables looked up by name.
+        """
         self._group = group
         self._create_union = create_union or CUnionBase
         self._blocks = None
-        self._unions = None
+        self.__unions = None
+        self._jobs = jobs
+        self._chunksize = chunksize
+        self._cache = cache
+        self._burst = burst
+        self._step = step or self.STEP
+        self._descriptors = descriptors
+        # width of unions, blocks are checked against it before rendering.
+        self._max_bits = getattr(self._create_union, "MAX_BITS", None)
 
     def generate(self):
         """
-        side effect: create self._blocks and self._unions
+        Join chunks of generate_iter().
+
+        side effect: create self._blocks
         """
-        blocks = self._group.dump()
-        unions = list(map(lambda b: self._create_union(b), blocks))
-        codes = list(map(lambda u: u.generate(), unions))
+        return "".join(self.generate_iter())
+
+    @property
+    def _unions(self):
+        """
+        Unions of self._blocks, created on first use. Blocks rendered in
+        parallel mode get their unions in the workers, the parent process
+        only creates them for subclasses using this.
+        """
+        if self.__unions is None and self._blocks is not None:
+            self.__unions = list(map(self._create_union, self._blocks))
+        return self.__unions
+
+    def generate_iter(self):
+        """
+        Yield the code block by block, "".join() of chunks equals generate().
+
+        side effect: create self._blocks before the first chunk.
 
+        NOTE:
+          Subclasses adding code override generate_iter(), not generate(),
+          so both generate() and write_to() have their code.
+        """
+        blocks = self._group.dump()
+        if self._max_bits is not None:
+            for block in blocks:
+                block.check_width(self._max_bits)
         self._blocks = blocks
-        self._unions = unions
-        return "\n".join(codes)
+        self.__unions = None
+
+        rec = instrument._active
+        if rec is None:
+            yield from self._join(blocks)
+        else:
+            rec.count("unions", len(blocks))
+            yield from rec.timed_iter(
+                "render", self._join(blocks), "chars_emitted")
+
+        if self._burst:
+            for run in self.find_runs(blocks, self.MIN_RUN, self._step):
+                yield "\n"
+                yield self._gen_bank(run, self._create_union(run[0]))
+
+        if self._descriptors:
+            code = self.DESCRIPTORS(self._group, blocks).generate()
+            if code:
+                yield "\n"
+                yield code
+
+    def _join(self, blocks):
+        if self._cache is not None:
+            # keys of the cache are taken from unions.
+            codes = self._render_cached(blocks, self._unions)
+        else:
+            codes = self._iter_codes(blocks)
+
+        for i, code in enumerate(codes):
+            if i:
+                yield "\n"
+            yield code
+
+    @staticmethod
+    def find_runs(blocks: Sequence[Block], min_len: int = 2, step: int = 1
+            ) -> List[List[Block]]:
+        """
+        Find runs of blocks at consecutive addresses, by the address given
+        by parser. Int addresses are consecutive when they differ by `step`,
+        tuple addresses when only their last items differ by `step`, e.g.
+        (1, 0x10) and (1, 0x11) with step 1. Blocks with other addresses are
+        skipped.
+
+        @output runs sorted by address, each one in order of addresses.
+        """
+        def key(block):
+            addr = block._addr
+            if type(addr) is int:
+                return ((), addr)
+            if type(addr) is tuple and addr and \
+                    all(type(a) is int for a in addr):
+                return (addr[:-1], addr[-1])
+            return None
+
+        items = [(key(b), b) for b in blocks]
+        items = sorted((i for i in items if i[0] is not None),
+                       key = lambda i: i[0])
+
+        runs = list()
+        run = list()
+        last = None
+        for k, block in items:
+            if last is not None and k[0] == last[0] and k[1] == last[1] + step:
+                run.append(block)
+            else:
+                if len(run) >= min_len:
+                    runs.append(run)
+                run = [block]
+            last = k
+        if len(run) >= min_len:
+            runs.append(run)
+        return runs
+
+    def _gen_bank(self, run: Sequence[Block], union) -> str:
+        first = run[0]
+        addr = first.address()
+        # the default transfer casts the address to a pointer.
+        default = \
+            self.TEMPLETE_BURST_READ is CGeneratorBase.TEMPLETE_BURST_READ or \
+            self.TEMPLETE_BURST_WRITE is CGeneratorBase.TEMPLETE_BURST_WRITE
+        if default and type(addr) is not int:
+            raise ValueError(
+                "Address {!r} of block {} isn't an int, override "
+                "TEMPLETE_BURST_READ/WRITE for bank functions of runs at "
+                "other addresses".format(addr, first.name()))
+
+        kw = dict(
+            name = first.name(),
+            count = len(run),
+            c_type = union.C_TYPE_FIELDS,
+            addr = addr,
+            raw = first._addr,
+            step = self._step,
+        )
+        return render_template(self.TEMPLETE_BANK,
+            read = render_template(self.TEMPLETE_BURST_READ, **kw),
+            write = render_template(self.TEMPLETE_BURST_WRITE, **kw),
+            **kw)
+
+    def write_to(self, fileobj) -> int:
+        """
+        Stream the code into a file object opened in text mode.
+
+        @output number of characters written
+        """
+        size = 0
+        for chunk in self.generate_iter():
+            fileobj.write(chunk)
+            size += len(chunk)
+        return size
+
+    def _iter_codes(self, blocks, unions = None):
+        """
+        @input unions: unions of blocks, self._unions by default, they are
+            unused in parallel mode.
+        """
+        if self._jobs is not None and len(blocks) > self._chunksize:
+            return self._iter_parallel(blocks)
+        if unions is None:
+            unions = self._unions
+        return map(lambda u: u.generate(), unions)
+
+    def _render(self, blocks, unions):
+        return list(self._iter_codes(blocks, unions))
+
+    def _render_cached(self, blocks, unions):
+        """
+        Splice cached codes and render the missed blocks.
+        """
+        keys = [RenderCache.key(u) for u in unions]
+        codes = self._cache.get_many(keys)
+
+        missed = [i for i, k in enumerate(keys) if k not in codes]
+        rec = instrument._active
+        if rec is not None:
+            rec.count("cache_hits", len(keys) - len(missed))
+            rec.count("cache_misses", len(missed))
+        rendered = self._render(
+            [blocks[i] for i in missed], [unions[i] for i in missed])
+        self._cache.put_many(
+            {keys[i]: c for i, c in zip(missed, rendered)})
+
+        for i, c in zip(missed, rendered):
+            codes[keys[i]] = c
+        return [codes[k] for k in keys]
+
+    def _iter_parallel(self, blocks):
+        """
+        Render blocks in a process pool, the codes are yielded in the same
+        order as blocks, so the output is the same as the serial one.
+        """
+        try:
+            pickle.dumps(self._create_union)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise TypeError(
+                "create_union must be picklable in parallel mode: {}".format(
+                    self._create_union)) from e
+
+        size = self._chunksize
+        jobs = self._jobs or os.cpu_count()
+        window = jobs * self.WINDOW
+
+        # chunks are submitted as results are consumed, so at most `window`
+        # chunks of blocks and codes are in flight.
+        with ProcessPoolExecutor(max_workers = jobs) as executor:
+            pending = deque()
+            try:
+                for i in range(0, len(blocks), size):
+                    pending.append(executor.submit(
+                        _render_chunk, self._create_union, blocks[i:i + size]))
+                    if len(pending) >= window:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
 
     @classmethod
     def once_only_header(cls, hfile_name):
@@ -181,3 +923,40 @@ class CGeneratorBase(GeneratorBase):
         ]).format(flag = flag)
         tail = "#endif /* {flag} */".format(flag = flag)
         return head, tail
+
+
+class CShadowGenerator(CGeneratorBase):
+    """
+    Generate CUnionShadow of blocks, plus sync_<group>() and flush_<group>()
+    for all blocks of the group.
+
+    Link to: CUnionShadow
+    """
+    TEMPLETE_ALL = (
+"""
+static inline void {action}_{group}(void)
+{{
+{calls}
+}}
+""")
+
+    TEMPLETE_CALL = "\t{action}_{block}();"
+
+    def __init__(self, group: Group, create_union = None, **kw):
+        super().__init__(group, create_union or CUnionShadow, **kw)
+
+    def generate_iter(self):
+        yield from super().generate_iter()
+        yield "\n"
+        yield self._gen_all("sync")
+        yield "\n"
+        yield self._gen_all("flush")
+
+    def _gen_all(self, action) -> str:
+        call = compile_template(self.TEMPLETE_CALL)
+        calls = [call(action = action, block = b.name()) for b in self._blocks]
+        return render_template(self.TEMPLETE_ALL,
+            action = action,
+            group = c_identifier(self._group),
+            calls = "\n".join(calls),
+        )
@@ -0,0 +1,236 @@
+from typing import Any, Callable, List, Optional, Tuple
+
+from .core import Block, Field, Group
+
+"""
+Index of blocks and fields of groups, for many lookups:
+
+    index = GroupIndex(group_a, group_b)
+    block, field = index.field("dev0_reset")
+    block = index.block("CONFIG0")
+    index.find(0x1004)              # blocks at an address
+    index.find((1, 0x04))           # addresses like (dev, addr)
+    index.range(0x1000, 0x2000)     # blocks in [0x1000, 0x2000)
+
+Names are looked up in dicts. Addresses are split into spaces by all but
+the last item of tuples, ints are in the space (). Blocks of a space are
+intervals [addr, addr + size) in a static interval tree: an array sorted by
+starts, where the middle of every slice is the root of the slice, augmented
+with the max end of the slice. So address queries take O(log n) plus the
+blocks found.
+
+Like Block and Group, the index is built lazily, and rebuilt by the next
+query after any of its groups is changed.
+
+Link to: class Validator
+"""
+
+AddrKeyType = Callable[[Block], Any]
+SizeType = Callable[[Block], int]
+
+
+def _default_key(block: Block) -> Any:
+    """
+    The raw address of blocks, None for addresses which are neither an int
+    nor a tuple ending with an int.
+    """
+    addr = block._addr
+    if type(addr) is int:
+        return addr
+    if type(addr) is tuple and addr and type(addr[-1]) is int:
+        return addr
+    return None
+
+
+def _split(addr) -> Tuple[tuple, int]:
+    if type(addr) is tuple:
+        return addr[:-1], addr[-1]
+    return (), addr
+
+
+class _Intervals():
+    """
+    Static interval tree of blocks in one address space.
+    """
+    def __init__(self, items: List[Tuple[int, int, Block]]):
+        items.sort(key = lambda i: i[0])
+        self.starts = [i[0] for i in items]
+        self.ends = [i[1] for i in items]
+        self.blocks = [i[2] for i in items]
+        # max_end[mid] is the max end of the slice rooted at mid.
+        self.max_end = self.ends.copy()
+        self.__augment(0, len(items))
+
+    def __augment(self, lo, hi) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        end = max(self.ends[mid],
+                  self.__augment(lo, mid),
+                  self.__augment(mid + 1, hi))
+        self.max_end[mid] = end
+        return end
+
+    def overlap(self, lo: int, hi: int) -> List[Block]:
+        """
+        Blocks overlapping [lo, hi), in order of addresses.
+        """
+        res = list()
+        self.__collect(0, len(self.starts), lo, hi, res)
+        return res
+
+    def __collect(self, l, h, lo, hi, res) -> None:
+        if l >= h:
+            return
+        mid = (l + h) // 2
+        if self.max_end[mid] <= lo:
+            return
+        self.__collect(l, mid, lo, hi, res)
+        if self.starts[mid] < hi:
+            if self.ends[mid] > lo:
+                res.append(self.blocks[mid])
+            self.__collect(mid + 1, h, lo, hi, res)
+
+
+class GroupIndex():
+    """
+    @input addr_key: address of blocks in the index, an int or a tuple
+        ending with an int; None leaves the block out of address queries.
+        The raw address given by parser by default.
+    @input size: number of addresses covered by blocks, 1 by default.
+
+    Name lookups return the first block or field of the name, in order of
+    groups and insertion, like Validator; blocks() and fields() return all
+    of them.
+    """
+    class NotFound(KeyError): pass
+
+    def __init__(self, *groups: Group,
+            addr_key: Optional[AddrKeyType] = None,
+            size: Optional[SizeType] = None):
+        self._groups = list(groups)
+        self._addr_key = addr_key or _default_key
+        self._size = size
+        self._versions = None
+
+    def add_group(self, group: Group) -> None:
+        self._groups.append(group)
+        self._versions = None
+
+    def groups(self) -> List[Group]:
+        return self._groups.copy()
+
+    def stale(self) -> bool:
+        """
+        Whether a group is changed since the index was built.
+        """
+        versions = self._versions
+        if versions is None:
+            return True
+        for group, version in zip(self._groups, versions):
+            if group._version != version:
+                return True
+        return False
+
+    def _build(self) -> None:
+        if not self.stale():
+            return
+
+        blocks = dict()
+        fields = dict()
+        spaces = dict()
+        addr_key = self._addr_key
+        size = self._size
+
+        # lists of names are only built for duplicated ones.
+        more_blocks = dict()
+        more_fields = dict()
+
+        # visit blocks in insertion order like Validator, without sorting.
+        for group in self._groups:
+            for block in group._blocks:
+                name = block.name()
+                if blocks.setdefault(name, block) is not block:
+                    more_blocks.setdefault(name, list()).append(block)
+
+                for field in block._fields:
+                    first = fields.setdefault(field.name, (block, field))
+                    if first[1] is not field:
+                        more_fields.setdefault(field.name, list()).append(
+                            (block, field))
+
+                addr = addr_key(block)
+                if addr is None:
+                    continue
+                space, start = _split(addr)
+                end = start + (size(block) if size else 1)
+                spaces.setdefault(space, list()).append((start, end, block))
+
+        self._blocks = blocks
+        self._fields = fields
+        self._more_blocks = more_blocks
+        self._more_fields = more_fields
+        self._spaces = {k: _Intervals(v) for k, v in spaces.items()}
+        self._versions = [g._version for g in self._groups]
+
+    def block(self, name: str) -> Block:
+        self._build()
+        try:
+            return self._blocks[name]
+        except KeyError:
+            raise self.NotFound("No block named {}".format(name)) from None
+
+    def field(self, name: str) -> Tuple[Block, Field]:
+        """
+        @output (block, field)
+        """
+        self._build()
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise self.NotFound("No field named {}".format(name)) from None
+
+    def blocks(self, name: str) -> List[Block]:
+        self._build()
+        if name not in self._blocks:
+            return list()
+        return [self._blocks[name]] + self._more_blocks.get(name, [])
+
+    def fields(self, name: str) -> List[Tuple[Block, Field]]:
+        self._build()
+        if name not in self._fields:
+            return list()
+        return [self._fields[name]] + self._more_fields.get(name, [])
+
+    def find(self, addr: Any) -> List[Block]:
+        """
+        Blocks covering the address.
+        """
+        space, start = _split(addr)
+        return self._overlap(space, start, start + 1)
+
+    def range(self, lo: Any, hi: Any) -> List[Block]:
+        """
+        Blocks overlapping [lo, hi), both are in the same address space,
+        e.g. range((1, 0x00), (1, 0x40)).
+        """
+        space, start = _split(lo)
+        space_hi, end = _split(hi)
+        if space != space_hi:
+            raise ValueError(
+                "Addresses {!r} and {!r} are in different spaces".format(lo, hi))
+        return self._overlap(space, start, end)
+
+    def spaces(self) -> List[tuple]:
+        """
+        Address spaces of blocks, () for int addresses.
+        """
+        self._build()
+        return list(self._spaces.keys())
+
+    def _overlap(self, space, lo, hi) -> List[Block]:
+        self._build()
+        tree = self._spaces.get(space)
+        if tree is None or lo >= hi:
+            return list()
+        return tree.overlap(lo, hi)
@@ -0,0 +1,134 @@
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+"""
+Instrumentation of parse, validate, sort and generate.
+
+    with Recorder() as rec:
+        group = parser.gen_group()
+        code = CGeneratorBase(group).generate()
+    print(rec.report())
+
+Phases (timers):
+- parse:    ParserBase.gen_group()
+- validate: Validator.run()
+- sort:     Group sorting its blocks
+- render:   CGeneratorBase rendering codes, time of the consumer of
+            generate_iter() is excluded
+
+Counters: rows, fields, blocks_created, group_sorts, block_sorts, unions,
+chars_emitted, cache_hits, cache_misses.
+
+Instrumented code only checks `_active is not None` when no recorder is
+active, so it costs nothing when disabled.
+"""
+
+# the active recorder, None means disabled
+_active = None
+
+PhaseCallback = Callable[[str, float], None]
+CountCallback = Callable[[str, int], None]
+
+
+def active() -> Optional['Recorder']:
+    return _active
+
+
+class _Phase():
+    __slots__ = ("_rec", "_name", "_start")
+
+    def __init__(self, rec, name):
+        self._rec = rec
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._rec.add_time(self._name, time.perf_counter() - self._start)
+
+
+class Recorder():
+    """
+    Collect timers and counters while it is active.
+
+    @input on_phase: called with (phase, seconds) at the end of every phase.
+    @input on_count: called with (counter, n) for every count.
+    """
+    def __init__(self,
+            on_phase: Optional[PhaseCallback] = None,
+            on_count: Optional[CountCallback] = None):
+        self.timers = dict()    # phase -> [calls, seconds]
+        self.counters = dict()
+        self._on_phase = on_phase
+        self._on_count = on_count
+        self._prev = list()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Activate the recorder, recorders can be nested.
+        """
+        global _active
+        self._prev.append(_active)
+        _active = self
+
+    def stop(self) -> None:
+        global _active
+        _active = self._prev.pop()
+
+    def phase(self, name: str) -> _Phase:
+        return _Phase(self, name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        timer = self.timers.get(name, None)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+        if self._on_phase is not None:
+            self._on_phase(name, seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self._on_count is not None:
+            self._on_count(name, n)
+
+    def timed_iter(self, name: str, chunks: Iterable[str],
+            counter: Optional[str] = None) -> Iterator[str]:
+        """
+        Time producing every chunk into phase `name`, and count their
+        lengths into `counter`.
+        """
+        it = iter(chunks)
+        seconds = 0.0
+        size = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    break
+                seconds += time.perf_counter() - start
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.add_time(name, seconds)
+            if counter is not None:
+                self.count(counter, size)
+
+    def report(self) -> Dict[str, dict]:
+        return dict(
+            timers = {k: dict(calls = c, seconds = s)
+                      for k, (c, s) in self.timers.items()},
+            counters = dict(self.counters),
+        )
@@ -0,0 +1,299 @@
+import gc
+import mmap
+import re
+import threading
+from contextlib import contextmanager
+from functools import reduce
+from itertools import repeat
+from operator import itemgetter, or_
+from typing import Any
+
+from . import instrument
+from .core import Field, ParserBase, SourceFile
+
+"""
+Bulk loader for csv register maps.
+
+The input is memory-mapped, and address rows are found by searching for
+their literal `,# addr=`. Rows between two address rows are the fields of a
+block, and they are usually all `,[range],name`: that is checked by
+counting commas and newlines of the segment, then the segment is split into
+cells at once, without running a pattern per row. Other segments, e.g. with
+comments or more cells, are scanned by one compiled pattern.
+Ranges are parsed once per distinct text, and the bitmasks of blocks once
+per distinct layout of ranges.
+
+Supported rows (same dialect as the demos):
+
+    # any comment
+    ,# addr=0x1000, BLOCK_NAME
+    ,# addr=(0x01 0x0000), BLOCK_NAME
+    ,[15:0],field_name
+    ,[3],field_name
+
+NOTE:
+  Quoted cells are not supported, rows with unknown formats are ignored.
+"""
+
+# The first cell of address rows is checked separately: it can't contain
+# "," nor start with "#".
+_ADDR_PATTERN = re.compile(rb",\# addr=([^,\r\n]*)(?:,([^,\r\n]*))?")
+
+_FIELD_PATTERN = re.compile(
+    rb"^(?!#)[^,\r\n]*,"
+    rb"(\[[ \t]*\d+[ \t]*(?::[ \t]*\d+[ \t]*)?\])(?=[,\r\n]|$)"
+    rb"(?:,([^,\r\n]*))?",
+    re.MULTILINE)
+
+_RANGE_PATTERN = re.compile(
+    r"\[[ \t]*(\d+)[ \t]*(?::[ \t]*(\d+)[ \t]*)?\]", re.ASCII)
+
+_HEX_PATTERN = re.compile(rb"0[xX][0-9a-fA-F]+")
+
+_bitmasks = itemgetter(2)
+_bits = itemgetter(3)
+
+# The cyclic gc is paused while loading, see _gc_paused().
+_gc_lock = threading.Lock()
+_gc_loads = 0
+_gc_enabled = False
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Loading allocates lots of small tuples, and every collection triggered
+    by them walks all the objects loaded so far, to free nothing. Cycles
+    between blocks and groups are still created, they are collected when gc
+    is enabled again.
+
+    Loads in threads share the pause: the first load disables gc and the
+    last one enables it again, if it was enabled before the first one.
+    """
+    global _gc_loads, _gc_enabled
+    with _gc_lock:
+        if not _gc_loads:
+            _gc_enabled = gc.isenabled()
+            gc.disable()
+        _gc_loads += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_loads -= 1
+            if not _gc_loads and _gc_enabled:
+                gc.enable()
+
+
+class CsvBulkParser(ParserBase):
+    """
+    A ready-made parser for large csv register maps.
+
+    Fields are created directly from the cells, block names are taken from
+    the address rows. With `source = True`, every field keeps a lazy
+    SourceRef to its row.
+
+    You can override some functions to change the default behavior:
+    - _extract_addr(): convert the text after `# addr=` into an address.
+    - _block_name(): generate block name from the address row.
+    """
+
+    class IllegalRow(ValueError): pass
+
+    def __init__(self, csv_file, gname = None, *args, source = False, **kw):
+        super().__init__(gname or str(csv_file), *args, **kw)
+        self._csv = csv_file
+        self._source = SourceFile(csv_file) if source else None
+
+    def _extract_addr(self, text: bytes) -> Any:
+        """
+        Return an int for "0x1000" and a tuple of ints for "(0x01 0x0000)".
+        """
+        values = _HEX_PATTERN.findall(text)
+        if not values:
+            raise self.IllegalRow("Unknow address format: {}".format(text))
+
+        if len(values) == 1:
+            return int(values[0], 16)
+        return tuple(int(v, 16) for v in values)
+
+    def _block_name(self, addr: Any, name: bytes) -> str:
+        name = name.decode().strip()
+        return name or self._find_block_name(addr)
+
+    @staticmethod
+    def _cal_range(text: str):
+        """
+        @output (bits, shift, bitmask), None for an illegal range.
+        """
+        m = _RANGE_PATTERN.fullmatch(text)
+        if m is None:
+            return None
+        high = int(m[1])
+        low = int(m[2]) if m[2] else high
+        if high < low:
+            high, low = low, high
+
+        bits = high - low + 1
+        return bits, low, Field.cal_bitmask(bits, low)
+
+    def _range(self, text: str):
+        ranges = self._ranges
+        if text not in ranges:
+            ranges[text] = self._cal_range(text)
+        return ranges[text]
+
+    def _layout(self, ranges: tuple):
+        """
+        @output (bitmasks, bits, shifts, OR of bitmasks, sum of bits) of the
+            ranges of a block, None if any range is illegal.
+        """
+        layouts = self._layouts
+        if ranges not in layouts:
+            parsed = [self._range(r) for r in ranges]
+            if None in parsed:
+                layouts[ranges] = None
+            else:
+                bits, shifts, bitmasks = (list(c) for c in zip(*parsed))
+                layouts[ranges] = (bitmasks, bits, shifts,
+                                   reduce(or_, bitmasks), sum(bits))
+        return layouts[ranges]
+
+    def _split_fields(self, data: bytes, addr):
+        """
+        Fields of a segment whose rows are all `,[range],name`, None for
+        other segments.
+
+        Every row starts with "," and has two commas, so the cells split at
+        commas alternate between ranges and names.
+        """
+        try:
+            text = data.decode().rstrip("\r\n")
+        except UnicodeDecodeError:
+            return None
+        if not text:
+            return list(), 0, 0
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+            if "\r" in text:
+                return None
+
+        rows = text.count("\n") + 1
+        if text[0] != "," or text.count(",") != 2 * rows or \
+                text.count("\n,") != rows - 1:
+            return None
+
+        cells = text.split(",")
+        layout = self._layout(tuple(cells[1::2]))
+        if layout is None:
+            return None
+
+        bitmasks, bits, shifts, occupied, nbits = layout
+        fields = list(map(tuple.__new__, repeat(Field), zip(
+            map(str.strip, cells[2::2]), repeat(addr), bitmasks, bits, shifts,
+            repeat(None), repeat(0), repeat(None), repeat(None))))
+        return fields, occupied, nbits
+
+    def _scan_fields(self, buf, start: int, end: int, addr):
+        """
+        Fields of rows in [start, end) of the buffer, by the pattern.
+        """
+        new = tuple.__new__
+        fields = list()
+
+        if self._source is None:
+            rows = zip(_FIELD_PATTERN.findall(buf, start, end), repeat(None))
+        else:
+            at = self._source.at
+            rows = [(m.groups(b""), at(m.start()))
+                    for m in _FIELD_PATTERN.finditer(buf, start, end)]
+
+        for (range_text, name), source in rows:
+            bits, shift, bitmask = self._range(range_text.decode())
+            fields.append(new(Field, (
+                name.decode().strip(), addr, bitmask, bits, shift,
+                None, 0, source, None)))
+
+        return fields, reduce(or_, map(_bitmasks, fields), 0), \
+            sum(map(_bits, fields))
+
+    def _segment(self, buf, start: int, end: int, block) -> int:
+        """
+        Add fields of rows in [start, end) to the block.
+
+        @output number of fields.
+        """
+        if start >= end:
+            return 0
+
+        addr = None if block is None else block._addr
+        res = None
+        if self._source is None:
+            res = self._split_fields(buf[start:end], addr)
+        if res is None:
+            res = self._scan_fields(buf, start, end, addr)
+
+        fields, occupied, nbits = res
+        if not fields:
+            return 0
+        if block is None:
+            raise self.IllegalRow(
+                "Field before any address: {}".format(fields[0].range()))
+
+        # fields have the address of the block, so without a checker they
+        # are added in bulk, checked by the OR and sum of their bitmasks.
+        if self._bulk:
+            block._adopt(fields, occupied, nbits)
+        else:
+            block.add_fields(fields)
+        return len(fields)
+
+    def _load(self, buf):
+        block = self._last_block
+        blocks = self._block_index
+        self._ranges = dict()
+        self._layouts = dict()
+        self._bulk = self._bcreator._checker is None
+
+        rec = instrument._active
+        created = len(blocks)
+        rows = 0
+
+        # start of the rows of `block`
+        start = 0
+        size = len(buf)
+        for m in _ADDR_PATTERN.finditer(buf):
+            hit = m.start()
+            line = buf.rfind(b"\n", 0, hit) + 1
+            lead = buf[line:hit]
+            if b"," in lead or b"\r" in lead or lead[:1] == b"#":
+                continue
+
+            rows += 1 + self._segment(buf, start, line, block)
+            start = buf.find(b"\n", m.end()) + 1 or size
+
+            addr = self._extract_addr(m[1])
+            block = blocks.get(addr, None)
+            if block is None:
+                block = self._bcreator.create(
+                    self._block_name(addr, m[2] or b""), addr)
+                self._group.add_block(block)
+                blocks[addr] = block
+
+        rows += self._segment(buf, start, size, block)
+        self._last_block = block
+
+        if rec is not None:
+            rec.count("rows", rows)
+            rec.count("blocks_created", len(blocks) - created)
+
+    def _parser(self):
+        with open(self._csv, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            except ValueError:
+                # mmap() refuses empty files.
+                return
+
+            with buf, _gc_paused():
+                self._load(buf)
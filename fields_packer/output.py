@@ -0,0 +1,150 @@
+import hashlib
+import os
+import tempfile
+from typing import Iterable
+
+"""
+Write generated files only when their contents are changed, so mtimes of
+unchanged outputs are kept and builds don't recompile their includers:
+
+    changed = write_if_changed("build/reg_all.h", code)
+
+    # or streamed, e.g. by GeneratorBase.write_to()
+    with OutputFile("build/reg_all.h") as f:
+        gen.write_to(f)
+
+    write_depfile("build/reg_all.d", ["build/reg_all.stamp"], ["bus.csv"])
+
+The new contents are written to a temporary file beside the output and
+hashed while writing, then compared with the hash of the old output, which
+is only read when both have the same size. A changed output replaces the
+old one atomically, so readers never see a partial file.
+
+Depfiles are in the Make syntax, which is also read by Ninja with
+`depfile = ...`. Since unchanged outputs keep their mtimes, set
+`restat = 1` for Ninja rules. With Make, let the depfile target a stamp
+touched after generating, else the generator runs every time once an input
+is touched without changes:
+
+    build/reg_all.h: build/reg_all.stamp ;
+    build/reg_all.stamp:
+    	python3 gen.py
+    	touch $@
+    -include build/reg_all.d
+"""
+
+CHUNK = 1 << 20
+
+
+def _digest():
+    return hashlib.blake2b(digest_size = 32)
+
+
+def _file_digest(path: str) -> bytes:
+    h = _digest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def _file_mode(path: str) -> int:
+    """
+    Mode of the existing output, or the default mode of new files.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+class OutputFile():
+    """
+    A file object opened in text mode, the output is replaced when it is
+    closed and its contents are changed. Nothing is written if an exception
+    is raised inside the `with` block.
+
+    `changed` tells whether the output was written, after it is closed.
+    """
+    def __init__(self, path: str, encoding: str = "utf-8"):
+        self._path = path
+        self._encoding = encoding
+        self._hash = _digest()
+        self._size = 0
+        self._file = None
+        self._tmp = None
+        self.changed = None
+
+    def __enter__(self) -> 'OutputFile':
+        fd, self._tmp = tempfile.mkstemp(
+            prefix = "." + os.path.basename(self._path) + ".",
+            dir = os.path.dirname(self._path) or ".")
+        self._file = os.fdopen(fd, "wb")
+        return self
+
+    def write(self, s: str) -> int:
+        data = s.encode(self._encoding)
+        self._hash.update(data)
+        self._size += len(data)
+        self._file.write(data)
+        return len(s)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._file.close()
+        if exc_type is not None:
+            os.unlink(self._tmp)
+            return
+
+        if self._same():
+            os.unlink(self._tmp)
+            self.changed = False
+            return
+
+        os.chmod(self._tmp, _file_mode(self._path))
+        os.replace(self._tmp, self._path)
+        self.changed = True
+
+    def _same(self) -> bool:
+        try:
+            if os.path.getsize(self._path) != self._size:
+                return False
+            return _file_digest(self._path) == self._hash.digest()
+        except FileNotFoundError:
+            return False
+
+
+def write_if_changed(path: str, content: str, encoding: str = "utf-8") -> bool:
+    """
+    @output whether the output was written.
+    """
+    with OutputFile(path, encoding) as f:
+        f.write(content)
+    return f.changed
+
+
+def _escape(path: str) -> str:
+    """
+    Escape a path for Make, as gcc does for depfiles.
+    """
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def write_depfile(path: str, targets: Iterable[str], deps: Iterable[str],
+        phony: bool = True, encoding: str = "utf-8") -> bool:
+    """
+    Write "targets: deps" in the Make syntax, and only if it is changed.
+
+    @input phony: add an empty rule for every dependency like `gcc -MP`, so
+        removing an input doesn't break the build.
+    @output whether the depfile was written.
+    """
+    targets = [_escape(os.path.normpath(t)) for t in targets]
+    deps = [_escape(os.path.normpath(d)) for d in deps]
+
+    lines = [" ".join(targets) + ":" + "".join(
+        " \\\n  " + d for d in deps)]
+    if phony:
+        lines.extend("\n{}:".format(d) for d in deps)
+    return write_if_changed(path, "\n".join(lines) + "\n", encoding)
@@ -0,0 +1,148 @@
+from typing import List, Sequence
+
+"""
+Minimal perfect hash of names, by hash and displace.
+
+Every key has two hashes, h0 = fnv1a(key, 0) picks its bucket and
+h1 = fnv1a(key, SALT) its slots. Buckets are placed from the largest one,
+each gets the first displacement d which moves all its keys into free slots
+(h1 ^ d) % len(keys). Buckets of a single key get a free slot directly,
+stored as -slot - 1. So a lookup is:
+
+    d = disp[h0 % len(disp)]
+    slot = -d - 1 if d < 0 else (h1 ^ d) % len(keys)
+
+and the key at the slot is compared once. Keys are hashed once while
+building, trying a displacement is a xor and a modulo. The same fnv1a is
+generated in C.
+
+Link to: CDescriptors
+"""
+
+FNV_OFFSET = 0x811c9dc5
+FNV_PRIME = 0x01000193
+MASK32 = 0xffffffff
+
+# seed of the second hash
+SALT = 0x9e3779b9
+
+# average number of keys in a bucket
+LOAD = 2
+
+# displacements tried for a bucket before the table is rebuilt with more
+# buckets
+MAX_DISP = 1 << 16
+
+
+def fnv1a(key: bytes, seed: int = 0) -> int:
+    h = (FNV_OFFSET ^ seed) & MASK32
+    for b in key:
+        h = ((h ^ b) * FNV_PRIME) & MASK32
+    return h
+
+
+class PerfectHash():
+    """
+    @input keys: unique names, they are encoded as utf-8.
+
+    slots[i] is the index in `keys` of the key at slot i.
+    """
+    class KeyDuplicated(ValueError): pass
+
+    def __init__(self, keys: Sequence[str], load: int = LOAD):
+        self.keys = list(keys)
+        data = [k.encode() for k in self.keys]
+        if len(set(data)) != len(data):
+            seen = set()
+            for k in self.keys:
+                if k in seen:
+                    raise self.KeyDuplicated("Duplicated key: {}".format(k))
+                seen.add(k)
+
+        hashes = [(fnv1a(k), fnv1a(k, SALT)) for k in data]
+        nbuckets = max(1, -(-len(data) // load))
+        while True:
+            res = self.__build(hashes, nbuckets)
+            if res is not None:
+                self.disp, self.slots = res
+                return
+            if nbuckets > len(data):
+                # only keys with both hashes equal can't be separated
+                raise ValueError("Failed to build a perfect hash of keys")
+            nbuckets *= 2
+
+    @staticmethod
+    def __build(hashes, nbuckets):
+        n = len(hashes)
+        buckets = [list() for _ in range(nbuckets)]
+        for i, (h0, _) in enumerate(hashes):
+            buckets[h0 % nbuckets].append(i)
+
+        disp = [0] * nbuckets
+        taken = bytearray(n)
+        slots = [-1] * n
+        order = sorted(range(nbuckets), key = lambda b: -len(buckets[b]))
+
+        singles = list()
+        for b in order:
+            bucket = buckets[b]
+            if len(bucket) == 0:
+                break
+            if len(bucket) == 1:
+                singles.append(b)
+                continue
+
+            h1s = [hashes[i][1] for i in bucket]
+            if len(h1s) == 2:
+                # most of tries are for pairs filling the last slots
+                a, c = h1s
+                for d in range(MAX_DISP):
+                    pa, pc = (a ^ d) % n, (c ^ d) % n
+                    if not taken[pa] and not taken[pc] and pa != pc:
+                        break
+                else:
+                    return None
+                pos = (pa, pc)
+            else:
+                for d in range(MAX_DISP):
+                    pos = [(h ^ d) % n for h in h1s]
+                    if not any(taken[p] for p in pos) and \
+                            len(set(pos)) == len(pos):
+                        break
+                else:
+                    return None
+
+            disp[b] = d
+            for p, i in zip(pos, bucket):
+                taken[p] = 1
+                slots[p] = i
+
+        free = (p for p in range(n) if not taken[p])
+        for b in singles:
+            p = next(free)
+            disp[b] = -p - 1
+            slots[p] = buckets[b][0]
+
+        return disp, slots
+
+    def index(self, key: str) -> int:
+        """
+        @output index of the key in `keys`, -1 if not found.
+        """
+        if not self.slots:
+            return -1
+
+        data = key.encode()
+        d = self.disp[fnv1a(data) % len(self.disp)]
+        if d < 0:
+            slot = -d - 1
+        else:
+            slot = (fnv1a(data, SALT) ^ d) % len(self.slots)
+        i = self.slots[slot]
+        return i if self.keys[i] == key else -1
+
+    def ordered(self) -> List[str]:
+        """
+        Keys in order of slots.
+        """
+        return [self.keys[i] for i in self.slots]
@@ -0,0 +1,730 @@
+import importlib
+import json
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+import zlib
+from functools import reduce
+from itertools import accumulate, chain, repeat
+from operator import or_
+from typing import Dict, List, Optional
+
+from .core import Field, FieldTable, FieldView, Block, Group
+from .core import SourceFile, SourceRef
+from .loader import _gc_paused
+
+"""
+Compact binary snapshot of a parsed Group.
+
+    save_group(group, "bus.fpsnap")
+    group = load_group("bus.fpsnap")
+
+Layout, all numbers are little-endian:
+
+    magic(8) version(u32) header_size(u32) header(json) sections...
+
+The json header describes the group and where every section is, sections
+are 8-byte aligned. Fields are stored column by column:
+- names of fields and blocks in buffers separated by NUL, compressed by zlib.
+- integer columns in the narrowest type of their values, a column of one
+  value is kept in the header only.
+- SourceRefs as (file, position, is_line) columns.
+- addresses of fields are the address of their block, defaults are 0, and
+  groups, other sources and extras are None; only the rare fields which
+  differ are stored, as sparse (row, value) columns.
+Other values (block addresses, defaults ...) are de-duplicated into a value
+table and columns keep their indexes. The file is mmapped and every column
+is decoded in bulk.
+
+Functions of BlockCreator and Group (checker, sortby, parse_addr) are saved
+by their import path when they are module-level functions. Others, e.g.
+lambdas, can't be saved; pass a `bcreator` to load_group() to restore them.
+
+WARNING:
+  Only load snapshots you trust, e.g. ones written by your own build. Like
+  pickle, loading imports the modules of saved functions and unpickles
+  values of other types, so a crafted snapshot can run arbitrary code.
+"""
+
+MAGIC = b"FPSNAP\x00\x00"
+VERSION = 2
+
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 8
+
+# value index 0 is always None
+_NONE = 0
+
+# field columns stored sparsely, with the value of the fields not stored
+_SPARSE = ("f_addr", "f_default", "f_group", "f_source", "f_extra")
+
+_BLOCK_OPTIONS = ("checker", "sortby", "parse_addr")
+_GROUP_OPTIONS = ("checker", "sortby")
+
+
+class SnapshotError(ValueError): pass
+
+
+def _typecode(lo: int, hi: int) -> str:
+    """
+    The narrowest array typecode holding [lo, hi].
+    """
+    for unsigned, signed, bits in (("B", "b", 8), ("H", "h", 16),
+                                   ("I", "i", 32), ("Q", "q", 64)):
+        if lo >= 0 and hi < (1 << bits):
+            return unsigned
+        if lo >= -(1 << (bits - 1)) and hi < (1 << (bits - 1)):
+            return signed
+    raise SnapshotError("Column values out of 64 bits: [{}, {}]".format(lo, hi))
+
+
+def _func_ref(func) -> Optional[str]:
+    if func is None:
+        return None
+
+    module = getattr(func, "__module__", None)
+    qualname = getattr(func, "__qualname__", None)
+    if not module or not qualname or "<" in qualname:
+        return None
+    try:
+        if _resolve(module + ":" + qualname) is not func:
+            return None
+    except (ImportError, AttributeError):
+        return None
+    return module + ":" + qualname
+
+
+def _resolve(ref: str):
+    module, qualname = ref.split(":")
+    obj = importlib.import_module(module)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class _ValueWriter():
+    """
+    De-duplicated table of values in a tagged binary encoding.
+    """
+    def __init__(self):
+        self._index = {(type(None), None): _NONE}
+        self.blob = bytearray(b"n")
+        self.count = 1
+        self.files = list()
+        self._file_ids = dict()
+
+    def file_id(self, f: SourceFile) -> int:
+        fid = self._file_ids.get(id(f), None)
+        if fid is None:
+            fid = self._file_ids[id(f)] = len(self.files)
+            self.files.append([str(f.path()), f._encoding])
+        return fid
+
+    def _key(self, value):
+        if type(value) is tuple:
+            return (tuple, tuple(self._key(v) for v in value))
+        if type(value) is SourceRef:
+            return (SourceRef, id(value._file), value._pos, value._is_line)
+        try:
+            hash(value)
+        except TypeError:
+            return None
+        # type is a part of the key, so 1, 1.0 and True are different.
+        return (type(value), value)
+
+    def add(self, value) -> int:
+        if value is None:
+            return _NONE
+
+        key = self._key(value)
+        idx = None if key is None else self._index.get(key, None)
+        if idx is None:
+            idx = self.count
+            self.count += 1
+            self._encode(value)
+            if key is not None:
+                self._index[key] = idx
+        return idx
+
+    def _encode(self, value) -> None:
+        out = self.blob
+        t = type(value)
+        if value is None:
+            out += b"n"
+        elif t is bool:
+            out += struct.pack("<cB", b"b", value)
+        elif t is int and -(1 << 63) <= value < (1 << 63):
+            out += struct.pack("<cq", b"i", value)
+        elif t is int:
+            data = value.to_bytes(
+                (value.bit_length() + 8) // 8, "little", signed = True)
+            out += struct.pack("<cI", b"I", len(data)) + data
+        elif t is float:
+            out += struct.pack("<cd", b"f", value)
+        elif t is str:
+            data = value.encode()
+            out += struct.pack("<cI", b"s", len(data)) + data
+        elif t is tuple:
+            out += struct.pack("<cI", b"t", len(value))
+            for v in value:
+                self._encode(v)
+        elif t is SourceRef:
+            out += struct.pack("<cIQB", b"r",
+                self.file_id(value._file), value._pos, value._is_line)
+        else:
+            data = pickle.dumps(value)
+            out += struct.pack("<cI", b"p", len(data)) + data
+
+
+class _ValueReader():
+    def __init__(self, mv, files: List[SourceFile]):
+        self._mv = mv
+        self._files = files
+
+    def read_all(self, count: int) -> list:
+        values = list()
+        pos = 0
+        for _ in range(count):
+            value, pos = self._decode(pos)
+            values.append(value)
+        return values
+
+    def _decode(self, pos):
+        mv = self._mv
+        tag = mv[pos]
+        pos += 1
+        if tag == 0x6e:     # n
+            return None, pos
+        if tag == 0x62:     # b
+            return bool(mv[pos]), pos + 1
+        if tag == 0x69:     # i
+            return struct.unpack_from("<q", mv, pos)[0], pos + 8
+        if tag == 0x66:     # f
+            return struct.unpack_from("<d", mv, pos)[0], pos + 8
+        if tag == 0x74:     # t
+            n, = struct.unpack_from("<I", mv, pos)
+            pos += 4
+            items = list()
+            for _ in range(n):
+                v, pos = self._decode(pos)
+                items.append(v)
+            return tuple(items), pos
+        if tag == 0x72:     # r
+            fid, p, is_line = struct.unpack_from("<IQB", mv, pos)
+            return SourceRef(self._files[fid], p, bool(is_line)), pos + 13
+
+        size, = struct.unpack_from("<I", mv, pos)
+        data = mv[pos + 4:pos + 4 + size]
+        pos += 4 + size
+        if tag == 0x49:     # I
+            return int.from_bytes(data, "little", signed = True), pos
+        if tag == 0x73:     # s
+            return str(data, "utf-8"), pos
+        if tag == 0x70:     # p
+            return pickle.loads(data), pos
+        raise SnapshotError("Unknow value tag: {!r}".format(chr(tag)))
+
+
+def _is_int64(value) -> bool:
+    return type(value) is int and -(1 << 63) <= value < (1 << 63)
+
+
+def _add_addrs(cols, addrs: list, add) -> Optional[int]:
+    """
+    Block addresses are usually all ints, or all tuples of ints of the same
+    length, they are stored as columns of ints then, else as indexes of
+    values.
+
+    @output 0 for ints, the length of tuples, or None for indexes.
+    """
+    if all(map(_is_int64, addrs)):
+        cols.add("b_addr", addrs)
+        return 0
+
+    items = len(addrs[0]) if type(addrs[0]) is tuple else 0
+    if items and all(type(a) is tuple and len(a) == items and
+                     all(map(_is_int64, a)) for a in addrs):
+        for i in range(items):
+            cols.add("b_addr_{}".format(i), [a[i] for a in addrs])
+        return items
+
+    cols.add("b_addr", [add(a) for a in addrs])
+    return None
+
+
+class _ColumnWriter():
+    """
+    Sections of the snapshot, integer columns are narrowed and columns of
+    one value are moved to the header.
+    """
+    def __init__(self):
+        self.sections = list()
+        self.consts = dict()
+
+    def add(self, key: str, col: list) -> None:
+        if not col:
+            return
+        lo, hi = min(col), max(col)
+        if lo == hi:
+            self.consts[key] = lo
+            return
+
+        arr = array(_typecode(lo, hi), col)
+        if sys.byteorder != "little":
+            arr.byteswap()
+        self.sections.append((key, arr.typecode, False, arr.tobytes()))
+
+    def add_names(self, key: str, names: List[str]) -> None:
+        blob = "\0".join(names)
+        if blob.count("\0") != max(len(names) - 1, 0):
+            raise SnapshotError("Names can't contain NUL")
+        self.sections.append((key, "", True, zlib.compress(blob.encode(), 1)))
+
+    def add_bytes(self, key: str, data: bytes) -> None:
+        self.sections.append((key, "", False, bytes(data)))
+
+
+def save_group(group: Group, path: str) -> None:
+    values = _ValueWriter()
+    funcs = list()
+    func_ids = dict()
+
+    def func_id(func) -> int:
+        ref = _func_ref(func)
+        if ref is None:
+            return -1
+        fid = func_ids.get(ref, None)
+        if fid is None:
+            fid = func_ids[ref] = len(funcs)
+            funcs.append(ref)
+        return fid
+
+    names = list()
+    f_bits = list()
+    f_shift = list()
+    s_file = list()
+    s_pos = list()
+    s_line = list()
+    sparse = {k: (list(), list()) for k in _SPARSE}
+    b_names = list()
+    b_addr = list()
+    b_count = list()
+    b_reverse = list()
+    b_max_bits = list()
+    b_funcs = list()
+    add = values.add
+    file_id = values.file_id
+    refs = False
+
+    def put(key, row, value):
+        rows, vals = sparse[key]
+        rows.append(row)
+        vals.append(add(value))
+
+    row = 0
+    for block in group._blocks:
+        block.sort()
+        addr = block._addr
+        b_names.append(block.name())
+        b_addr.append(addr)
+        b_count.append(len(block._fields))
+        b_reverse.append(block.reverse)
+        b_max_bits.append(-1 if block._max_bits is None else block._max_bits)
+        options = block.options()
+        b_funcs.extend(func_id(options[k]) for k in _BLOCK_OPTIONS)
+
+        for f in block._fields:
+            names.append(f.name)
+            f_bits.append(f.bits)
+            f_shift.append(f.shift)
+
+            f_addr = f.addr
+            if f_addr is not addr and \
+                    (type(f_addr) is not type(addr) or f_addr != addr):
+                put("f_addr", row, f_addr)
+            default = f.default
+            if not (type(default) is int and default == 0):
+                put("f_default", row, default)
+            if f.group is not None:
+                put("f_group", row, f.group)
+            if f.extra is not None:
+                put("f_extra", row, f.extra)
+
+            source = f.source
+            if type(source) is SourceRef:
+                refs = True
+                s_file.append(file_id(source._file))
+                s_pos.append(source._pos)
+                s_line.append(source._is_line)
+            else:
+                s_file.append(-1)
+                s_pos.append(0)
+                s_line.append(0)
+                if source is not None:
+                    put("f_source", row, source)
+            row += 1
+
+    cols = _ColumnWriter()
+    cols.add_names("names", names)
+    cols.add_names("b_names", b_names)
+    cols.add("f_bits", f_bits)
+    cols.add("f_shift", f_shift)
+    # SourceRef columns are omitted when there is no SourceRef.
+    if refs:
+        cols.add("s_file", s_file)
+        cols.add("s_pos", s_pos)
+        cols.add("s_line", s_line)
+    for key, (rows, vals) in sparse.items():
+        cols.add(key + "_row", rows)
+        cols.add(key + "_val", vals)
+    b_addr_items = _add_addrs(cols, b_addr, add)
+    cols.add("b_count", b_count)
+    cols.add("b_reverse", b_reverse)
+    cols.add("b_max_bits", b_max_bits)
+    cols.add("b_funcs", b_funcs)
+    options = group.options()
+    header = dict(
+        name = add(group.name()),
+        desc = add(group.desc()),
+        reverse = group.reverse,
+        funcs = funcs,
+        group_funcs = [func_id(options[k]) for k in _GROUP_OPTIONS],
+        files = values.files,
+        blocks = len(b_count),
+        fields = len(names),
+        b_addr_items = b_addr_items,
+        values = values.count,
+        consts = cols.consts,
+        sections = dict(),
+    )
+    cols.add_bytes("values", values.blob)
+
+    offset = 0
+    layout = list()
+    for key, typecode, compressed, data in cols.sections:
+        layout.append((key, offset, len(data), typecode, compressed))
+        offset += -(-len(data) // _ALIGN) * _ALIGN
+
+    # offsets of sections depend on the size of the header, so the header is
+    # padded to an aligned size which holds the final offsets.
+    base = 0
+    while True:
+        header["sections"] = {k: [base + o, s, t, z]
+                              for k, o, s, t, z in layout}
+        raw = json.dumps(header).encode()
+        if _PREFIX.size + len(raw) <= base:
+            break
+        base = -(-(_PREFIX.size + len(raw) + 16 * len(layout)) // _ALIGN) \
+            * _ALIGN
+    raw += b" " * (base - _PREFIX.size - len(raw))
+
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(raw)))
+        f.write(raw)
+        for _, _, _, data in cols.sections:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % _ALIGN))
+
+
+def load_group(path: str, bcreator: Optional[Block.BlockCreator] = None,
+        table: Optional[FieldTable] = None) -> Group:
+    """
+    WARNING: trusted input only, loading a snapshot imports modules named in
+    it and unpickles values, like pickle.load().
+
+    @input bcreator: create blocks with it instead of the saved functions.
+    @input table: store fields into the FieldTable, its columns are filled
+        from the snapshot in bulk.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            # like CsvBulkParser, lots of small tuples.
+            with _gc_paused():
+                return _load(mm, bcreator, table)
+
+
+class _Columns():
+    def __init__(self, mm, header):
+        self._mm = mm
+        self._sections = header["sections"]
+        self._consts = header["consts"]
+
+    def __contains__(self, key):
+        return key in self._sections or key in self._consts
+
+    def raw(self, key) -> bytes:
+        offset, size, _, compressed = self._sections[key]
+        data = self._mm[offset:offset + size]
+        return zlib.decompress(data) if compressed else data
+
+    def get(self, key, n: int):
+        """
+        The column of n integers, a list for columns of one value, None for
+        omitted columns.
+        """
+        if key in self._consts:
+            return [self._consts[key]] * n
+        if key not in self._sections:
+            return None
+        col = array(self._sections[key][2])
+        col.frombytes(self.raw(key))
+        if sys.byteorder != "little":
+            col.byteswap()
+        return col
+
+    def const(self, key) -> Optional[int]:
+        """
+        The value of a column of one value, None for other columns.
+        """
+        return self._consts.get(key, None)
+
+    def names(self, key) -> List[str]:
+        return str(self.raw(key), "utf-8").split("\0")
+
+    def sparse(self, key, values) -> Dict[int, object]:
+        """
+        row -> value of a sparse column.
+        """
+        rows = self.get(key + "_row", 1)
+        if rows is None:
+            return dict()
+        vals = self.get(key + "_val", len(rows))
+        return dict(zip(rows, map(values.__getitem__, vals)))
+
+
+def _patched(n, default, patches):
+    """
+    A column of n `default` with values of `patches`, row -> value.
+    """
+    if not patches:
+        return repeat(default, n)
+    col = [default] * n
+    for row, value in patches.items():
+        col[row] = value
+    return col
+
+
+def _load(mm, bcreator, table):
+    magic, version, size = _PREFIX.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Not a fields_packer snapshot")
+    if version != VERSION:
+        raise SnapshotError("Unsupported snapshot version: {}".format(version))
+
+    header = json.loads(mm[_PREFIX.size:_PREFIX.size + size])
+    cols = _Columns(mm, header)
+    n = header["fields"]
+    nblocks = header["blocks"]
+
+    files = [SourceFile(path, enc) for path, enc in header["files"]]
+    offset, size, _, _ = header["sections"]["values"]
+    with memoryview(mm)[offset:offset + size] as mv:
+        values = _ValueReader(mv, files).read_all(header["values"])
+
+    funcs = list()
+    for ref in header["funcs"]:
+        try:
+            funcs.append(_resolve(ref))
+        except (ImportError, AttributeError):
+            funcs.append(None)
+
+    def func(fid):
+        return None if fid < 0 else funcs[fid]
+
+    b_names = cols.names("b_names") if nblocks else list()
+    b_addr = _load_addrs(cols, header["b_addr_items"], nblocks, values)
+    b_count = cols.get("b_count", nblocks) or list()
+    b_reverse = cols.get("b_reverse", nblocks)
+    b_max_bits = cols.get("b_max_bits", nblocks)
+    b_funcs = cols.get("b_funcs", 3 * nblocks)
+
+    bits = cols.get("f_bits", n) or list()
+    shift = cols.get("f_shift", n) or list()
+    masks = {k: Field.cal_bitmask(*k) for k in set(zip(bits, shift))}
+    f_masks = list(map(masks.__getitem__, zip(bits, shift)))
+
+    if table is not None:
+        fields = _fill_table(table, n, cols, values, files, b_addr, b_count,
+                             bits, shift)
+    else:
+        fields = _make_fields(n, cols, values, files, b_addr, b_count,
+                              bits, shift, f_masks)
+
+    # (checker, sortby, parse_addr) of blocks
+    options = zip(*[map(func, b_funcs or ())] * 3)
+    ends = list(accumulate(b_count, initial = 0))
+    nbits = list(accumulate(bits, initial = 0))
+
+    blocks = list()
+    for i, (name, addr, opts) in enumerate(zip(b_names, b_addr, options)):
+        start, end = ends[i], ends[i + 1]
+        if bcreator is not None:
+            block = bcreator.create(name, addr)
+        else:
+            checker, sortby, parse_addr = opts
+            block = Block(name, addr,
+                          checker = checker,
+                          sortby = sortby,
+                          parse_addr = parse_addr,
+                          table = table,
+                          max_bits = None if b_max_bits[i] < 0 else b_max_bits[i])
+            if b_reverse[i]:
+                block.reverse = True
+        block._adopt(fields[start:end], reduce(or_, f_masks[start:end], 0),
+                     nbits[end] - nbits[start])
+        blocks.append(block)
+
+    gfuncs = header["group_funcs"]
+    group = Group(values[header["name"]], values[header["desc"]],
+                  blocks,
+                  checker = func(gfuncs[0]),
+                  sortby = func(gfuncs[1]))
+    group.reverse = header["reverse"]
+    return group
+
+
+def _load_addrs(cols, items, nblocks, values) -> list:
+    """
+    Link to: _add_addrs()
+    """
+    if not nblocks:
+        return list()
+    if items is None:
+        return [values[vid] for vid in cols.get("b_addr", nblocks)]
+    if not items:
+        return list(cols.get("b_addr", nblocks))
+    return list(zip(*(cols.get("b_addr_{}".format(i), nblocks)
+                      for i in range(items))))
+
+
+def _field_addrs(cols, values, b_addr, b_count):
+    """
+    Addresses of fields, the address of their block but for the sparse
+    ones.
+    """
+    addrs = list(chain.from_iterable(map(repeat, b_addr, b_count)))
+    for row, addr in cols.sparse("f_addr", values).items():
+        addrs[row] = addr
+    return addrs
+
+
+def _sources(n, cols, values, files):
+    others = cols.sparse("f_source", values)
+    if "s_file" not in cols:
+        return _patched(n, None, others)
+
+    # files and is_line are usually the same for all fields.
+    s_file = cols.get("s_file", n)
+    fid = cols.const("s_file")
+    if fid is None:
+        s_files = map(files.__getitem__, s_file)
+    else:
+        s_files = repeat(files[fid], n)
+    line = cols.const("s_line")
+    if line is None:
+        s_line = map(bool, cols.get("s_line", n))
+    else:
+        s_line = repeat(bool(line), n)
+
+    sources = list(map(SourceRef, s_files, cols.get("s_pos", n), s_line))
+    # fields without a SourceRef have file -1.
+    if fid is None and min(s_file) < 0:
+        for row, fid in enumerate(s_file):
+            if fid < 0:
+                sources[row] = others.get(row, None)
+    return sources
+
+
+def _make_fields(n, cols, values, files, b_addr, b_count, bits, shift,
+        f_masks) -> List[Field]:
+    if not n:
+        return list()
+
+    rows = zip(
+        cols.names("names"),
+        _field_addrs(cols, values, b_addr, b_count),
+        f_masks,
+        bits,
+        shift,
+        _patched(n, None, cols.sparse("f_group", values)),
+        _patched(n, 0, cols.sparse("f_default", values)),
+        _sources(n, cols, values, files),
+        _patched(n, None, cols.sparse("f_extra", values)))
+    return list(map(tuple.__new__, repeat(Field, n), rows))
+
+
+def _extend(arr: array, col) -> None:
+    """
+    array.extend() refuses arrays of other typecodes.
+    """
+    if type(col) is array and col.typecode != arr.typecode:
+        col = col.tolist()
+    arr.extend(col)
+
+
+def _fill_table(table, n, cols, values, files, b_addr, b_count, bits, shift
+        ) -> List[FieldView]:
+    """
+    Append the columns to the table in bulk and return FieldViews.
+    """
+    if not n:
+        return list()
+
+    base = len(table)
+    names = cols.raw("names").split(b"\0")
+    ends = accumulate(map(len, names), initial = len(table._name_buf))
+    next(ends)
+    table._name_end.extend(ends)
+    table._name_buf += b"".join(names)
+    _extend(table._bits, bits)
+    _extend(table._shift, shift)
+
+    def addr_id(addr):
+        aid = table._addr_ids.get(addr, None)
+        if aid is None:
+            aid = table._addr_ids[addr] = len(table._addrs)
+            table._addrs.append(addr)
+        return aid
+
+    table._addr_col.extend(chain.from_iterable(
+        map(repeat, map(addr_id, b_addr), b_count)))
+    for row, addr in cols.sparse("f_addr", values).items():
+        table._addr_col[base + row] = addr_id(addr)
+
+    # rows of values which don't fit in columns, like FieldTable.append().
+    defaults = cols.sparse("f_default", values)
+    groups = cols.sparse("f_group", values)
+    extras = cols.sparse("f_extra", values)
+    table._default.frombytes(bytes(n * table._default.itemsize))
+    rows = set(groups).union(extras)
+    for row, default in defaults.items():
+        if type(default) is int and 0 <= default < (1 << 64):
+            table._default[base + row] = default
+        else:
+            rows.add(row)
+
+    others = cols.sparse("f_source", values)
+    rows.update(others)
+    if "s_file" in cols:
+        sources = _sources(n, cols, values, files)
+        # fields with a SourceRef are all sparse.
+        s_file = cols.get("s_file", n)
+        if min(s_file) >= 0:
+            rows = range(n)
+        else:
+            rows.update(row for row, fid in enumerate(s_file) if fid >= 0)
+    else:
+        sources = _patched(n, None, others)
+
+    if type(rows) is range:
+        table._sparse.update(zip(range(base, base + n), zip(
+            _patched(n, None, groups), _patched(n, 0, defaults), sources,
+            _patched(n, None, extras))))
+    else:
+        for row in sorted(rows):
+            table._sparse[base + row] = (groups.get(row, None),
+                defaults.get(row, 0), sources[row], extras.get(row, None))
+
+    return list(map(FieldView, repeat(table, n), range(base, base + n)))
@@ -0,0 +1,80 @@
+import keyword
+import string
+from functools import lru_cache
+from typing import Callable
+
+"""
+Compile str.format() templates into render functions.
+
+    render = compile_template("\t\t{c_type} {name}:{bits};")
+    render(c_type = "uint32_t", name = "en", bits = 1)
+
+The render function is built from an f-string, so it doesn't parse the
+template again for every call. Calling it with keywords gives the same
+result as template.format(**kw), unused keywords are ignored as well.
+
+Templates with positional fields ("{}", "{0}"), attribute or index lookups
+("{a.b}", "{a[0]}") or nested format specs fall back to template.format.
+"""
+
+_formatter = string.Formatter()
+
+_LITERAL = "_fp_literal{}"
+
+
+def _field_code(field, spec, conversion):
+    if not field.isidentifier() or keyword.iskeyword(field):
+        return None
+    if field.startswith("_fp_"):
+        return None
+    if spec and any(c in spec for c in "{}\"'\\\n"):
+        return None
+
+    code = field
+    if conversion:
+        code += "!" + conversion
+    if spec:
+        code += ":" + spec
+    return "{" + code + "}"
+
+
+@lru_cache(maxsize = None)
+def compile_template(template: str) -> Callable[..., str]:
+    """
+    Templates are compiled once and shared by all classes using them, so
+    overriding a template in subclass just compiles the new one.
+    """
+    try:
+        parsed = list(_formatter.parse(template))
+    except ValueError:
+        return template.format
+
+    namespace = dict()
+    names = list()
+    pieces = list()
+    for literal, field, spec, conversion in parsed:
+        if literal:
+            var = _LITERAL.format(len(namespace))
+            namespace[var] = literal
+            pieces.append("{" + var + "}")
+
+        if field is None:
+            continue
+
+        code = _field_code(field, spec, conversion)
+        if code is None:
+            return template.format
+        if field not in names:
+            names.append(field)
+        pieces.append(code)
+
+    args = (["*"] + names if names else []) + ["**_fp_unused"]
+    source = "def render({args}):\n    return f\"{body}\"\n".format(
+        args = ", ".join(args), body = "".join(pieces))
+
+    exec(compile(source, "<template {!r}>".format(template), "exec"), namespace)
+    return namespace["render"]
+
+
+def render_template(template: str, **kw) -> str:
+    return compile_template(template)(**kw)
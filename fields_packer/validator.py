@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+from collections import namedtuple
+from typing import List, Optional
+
+from . import instrument
+
+"""
+Validator of names and addresses across groups.
+
+It visits every block and field once in insertion order (no sorting), and
+keeps the name/address indexes for later lookups:
+
+    v = Validator(group_a, group_b)
+    findings = v.run()
+    field = v.field_names["dev0_reset"]
+"""
+
+Finding = namedtuple("Finding", [
+    "kind",     # Validator.KIND_*
+    "key",      # the duplicated name or address
+    "first",    # the object seen first
+    "second",   # the duplicated one
+])
+
+
+# Blocks of the validator running in parallel, inherited by forked workers.
+_shard_blocks = None
+
+
+def _index_shard(bounds):
+    """
+    Worker of Validator in parallel mode.
+
+    Return indexes of the shard as key -> location, locations are indexes of
+    blocks and (block, field) pairs, plus findings inside the shard.
+    """
+    start, end = bounds
+    blocks = dict()
+    addrs = dict()
+    fields = dict()
+    findings = list()
+
+    for bi in range(start, end):
+        block = _shard_blocks[bi]
+        for kind, index, key in (
+                (Validator.KIND_BLOCK_NAME, blocks, block.name()),
+                (Validator.KIND_BLOCK_ADDRESS, addrs, block.address())):
+            if key is None:
+                continue
+            first = index.setdefault(key, bi)
+            if first != bi:
+                findings.append((kind, key, first, bi))
+
+        for fi, field in enumerate(block._fields):
+            if field.name is None:
+                continue
+            first = fields.setdefault(field.name, (bi, fi))
+            if first != (bi, fi):
+                findings.append(
+                    (Validator.KIND_FIELD_NAME, field.name, first, (bi, fi)))
+
+    return blocks, addrs, fields, findings
+
+
+class Validator():
+    """
+    Groups can be added later, run() only visits groups which are not
+    validated yet, so indexes are reused between runs.
+
+    Link to: Group.check_duplicated_name()
+    """
+    KIND_BLOCK_NAME = "block name"
+    KIND_BLOCK_ADDRESS = "block address"
+    KIND_FIELD_NAME = "field name"
+
+    class ValidationError(ValueError):
+        def __init__(self, findings: List[Finding]):
+            self.findings = findings
+            super().__init__("{} duplicated items, first: {} {}".format(
+                len(findings), findings[0].kind, findings[0].key))
+
+    def __init__(self, *groups):
+        self._groups = list(groups)
+        self._validated = 0
+
+        self.block_names = dict()
+        self.block_addrs = dict()
+        self.field_names = dict()
+        self.findings = list()
+
+    def add_group(self, group) -> None:
+        self._groups.append(group)
+
+    def run(self, raise_error: bool = False,
+            jobs: Optional[int] = None) -> List[Finding]:
+        """
+        Validate groups added since last run and return their findings.
+
+        @input raise_error: raise ValidationError if anything is found.
+        @input jobs: index blocks in `jobs` processes, 0 means the number of
+            CPUs. Only used where processes can be forked, so blocks are not
+            pickled.
+        """
+        groups = self._groups[self._validated:]
+        self._validated = len(self._groups)
+
+        rec = instrument._active
+        if rec is None:
+            findings = self._validate(groups, jobs)
+        else:
+            with rec.phase("validate"):
+                findings = self._validate(groups, jobs)
+
+        self.findings.extend(findings)
+        if raise_error and findings:
+            raise self.ValidationError(findings)
+        return findings
+
+    def _validate(self, groups, jobs) -> List[Finding]:
+        blocks = [b for g in groups for b in g._blocks]
+        if jobs is not None and len(blocks) > 1 and \
+                "fork" in multiprocessing.get_all_start_methods():
+            return self._run_parallel(blocks, jobs or os.cpu_count())
+        return self._run(blocks)
+
+    def _run(self, blocks) -> List[Finding]:
+        findings = list()
+        block_names = self.block_names
+        block_addrs = self.block_addrs
+        field_names = self.field_names
+
+        for block in blocks:
+            key = block.name()
+            first = block_names.setdefault(key, block)
+            if first is not block:
+                findings.append(Finding(self.KIND_BLOCK_NAME, key, first, block))
+
+            key = block.address()
+            if key is not None:
+                first = block_addrs.setdefault(key, block)
+                if first is not block:
+                    findings.append(
+                        Finding(self.KIND_BLOCK_ADDRESS, key, first, block))
+
+            for field in block._fields:
+                key = field.name
+                if key is None:
+                    continue
+                first = field_names.setdefault(key, field)
+                if first is not field:
+                    findings.append(
+                        Finding(self.KIND_FIELD_NAME, key, first, field))
+
+        return findings
+
+    def _run_parallel(self, blocks, jobs) -> List[Finding]:
+        """
+        Every worker indexes a contiguous shard of blocks, then shards are
+        merged in order with set and dict operations.
+        """
+        global _shard_blocks
+
+        size = -(-len(blocks) // jobs)
+        bounds = [(i, min(i + size, len(blocks)))
+                  for i in range(0, len(blocks), size)]
+
+        # memoize addresses before forking, so workers don't compute them.
+        for block in blocks:
+            block.address()
+
+        _shard_blocks = blocks
+        try:
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(len(bounds)) as pool:
+                shards = pool.map(_index_shard, bounds)
+        finally:
+            _shard_blocks = None
+
+        def resolve(loc):
+            if isinstance(loc, tuple):
+                bi, fi = loc
+                return blocks[bi]._fields[fi]
+            return blocks[loc]
+
+        # findings are sorted as the serial run visits them: by block, then
+        # block name, block address and fields of the block.
+        rank = {
+            self.KIND_BLOCK_NAME: 0,
+            self.KIND_BLOCK_ADDRESS: 1,
+            self.KIND_FIELD_NAME: 2,
+        }
+
+        def order(kind, loc):
+            if isinstance(loc, tuple):
+                return (loc[0], rank[kind], loc[1])
+            return (loc, rank[kind], 0)
+
+        # shards are merged in order, so the first occurrence wins as in the
+        # serial run.
+        found = list()
+        indexes = {
+            self.KIND_BLOCK_NAME: self.block_names,
+            self.KIND_BLOCK_ADDRESS: self.block_addrs,
+            self.KIND_FIELD_NAME: self.field_names,
+        }
+        for shard in shards:
+            # duplicates inside the shard, the first one may be in earlier
+            # shards.
+            for kind, key, first, second in shard[3]:
+                first = indexes[kind].get(key, None) or resolve(first)
+                found.append((order(kind, second),
+                              Finding(kind, key, first, resolve(second))))
+
+            for (kind, index), locs in zip(indexes.items(), shard[:3]):
+                for key, loc in locs.items():
+                    first = index.get(key, None)
+                    if first is None:
+                        index[key] = resolve(loc)
+                    else:
+                        found.append((order(kind, loc),
+                                      Finding(kind, key, first, resolve(loc))))
+
+        found.sort(key = lambda f: f[0])
+        return [f for _, f in found]
+
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from .core import Group, ParserBase
+from .output import write_if_changed
+
+"""
+Long-running mode, which keeps parsed groups in memory and regenerates
+outputs when their sources change:
+
+    w = Watcher()
+    w.add_group("bus", lambda: BusCsvParser("bus.csv"), ["bus.csv"])
+    w.add_group("map", lambda: MapCsvParser("map.csv"), ["map.csv"])
+    w.add_output("build/reg_all.h", [
+        ("bus", lambda g: BusGenerator(g).generate()),
+        ("map", lambda g: MapGenerator(g).generate()),
+    ])
+    w.run()
+
+Sources are polled by os.stat() every `interval` seconds, a source is
+changed when its mtime, size or inode is changed, so editors replacing
+files are seen too. Only groups of changed sources are parsed again, with
+new parsers from their factories, and only outputs using them are written,
+if their contents are changed.
+Sections of outputs are cached per group, so unchanged groups aren't
+generated again.
+
+A source failing to parse, e.g. in the middle of an edit, is reported by
+`on_error` and the last good group is kept until the source changes again.
+"""
+
+ParserFactory = Callable[[], ParserBase]
+SectionType = Tuple[Any, Callable[[Group], str]]
+
+_Signature = Optional[Tuple[int, int, int]]
+
+
+def _signature(path: str) -> _Signature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _print_error(key, err) -> None:
+    Group.print_error("Failed to update {}: {}".format(key, err))
+
+
+class _Entry():
+    def __init__(self, parser: ParserFactory, sources: Sequence[str]):
+        self.parser = parser
+        self.sources = list(sources)
+        self.signatures = None
+        self.group = None
+
+
+class _Output():
+    def __init__(self, path, sections, head, tail, sep):
+        self.path = path
+        self.sections = list(sections)
+        self.head = head
+        self.tail = tail
+        self.sep = sep
+        # key -> (group, code) of the last generation
+        self.codes = dict()
+
+
+class Watcher():
+    """
+    @input interval: seconds between polls.
+    @input executor: executor of ParserBase.gen_group_async(), changed
+        sources are parsed concurrently.
+    @input on_error: called with (key, exception) when a group fails to
+        parse or an output fails to generate.
+    @input on_write: called with the path of every written output, outputs
+        with unchanged contents aren't written.
+
+    Link to: gather_groups()
+    """
+    class KeyDuplicated(ValueError): pass
+
+    def __init__(self, interval: float = 0.2,
+            executor: Optional[Executor] = None,
+            on_error: Optional[Callable[[Any, Exception], None]] = None,
+            on_write: Optional[Callable[[str], None]] = None):
+        self._interval = interval
+        self._executor = executor
+        self._on_error = on_error or _print_error
+        self._on_write = on_write
+        self._entries = dict()
+        self._outputs = list()
+
+    def add_group(self, key: Any, parser: ParserFactory,
+            sources: Sequence[str]) -> None:
+        """
+        @input parser: creates a new parser of the group, it is called again
+            for every change because parsers parse once.
+        @input sources: files read by the parser.
+        """
+        if key in self._entries:
+            raise self.KeyDuplicated("Duplicated group: {}".format(key))
+        self._entries[key] = _Entry(parser, sources)
+
+    def add_output(self, path: str, sections: Sequence[SectionType],
+            head: str = "", tail: str = "", sep: str = "\n") -> None:
+        """
+        The output is `head`, codes of sections and `tail` joined by `sep`,
+        empty head and tail are skipped.
+
+        @input sections: (key of group, function generating code of the
+            group).
+        """
+        for key, _ in sections:
+            if key not in self._entries:
+                raise KeyError("Unknown group: {}".format(key))
+        self._outputs.append(_Output(path, sections, head, tail, sep))
+
+    def group(self, key: Any) -> Optional[Group]:
+        """
+        The last good group, None before it is parsed.
+        """
+        return self._entries[key].group
+
+    def poll(self) -> List[str]:
+        """
+        Parse groups of changed sources and write outputs using them.
+
+        @output paths of written outputs.
+        """
+        changed = list()
+        for key, entry in self._entries.items():
+            signatures = [_signature(s) for s in entry.sources]
+            if signatures != entry.signatures:
+                # taken before parsing, so edits while parsing are seen by
+                # the next poll.
+                entry.signatures = signatures
+                changed.append(key)
+        if not changed:
+            return list()
+
+        parsed = set(self._parse(changed))
+
+        written = list()
+        for output in self._outputs:
+            if not any(key in parsed for key, _ in output.sections):
+                continue
+            if self._write(output):
+                written.append(output.path)
+        return written
+
+    def _parse(self, keys) -> List[Any]:
+        parsers = list()
+        for key in keys:
+            try:
+                parsers.append((key, self._entries[key].parser()))
+            except Exception as e:
+                self._on_error(key, e)
+
+        async def gather():
+            return await asyncio.gather(
+                *(p.gen_group_async(self._executor) for _, p in parsers),
+                return_exceptions = True)
+
+        parsed = list()
+        for (key, _), res in zip(parsers, asyncio.run(gather())):
+            if isinstance(res, Exception):
+                self._on_error(key, res)
+                continue
+            self._entries[key].group = res
+            parsed.append(key)
+        return parsed
+
+    def _write(self, output: _Output) -> bool:
+        codes = list()
+        for key, generate in output.sections:
+            group = self._entries[key].group
+            if group is None:
+                # never parsed successfully
+                return False
+
+            last = output.codes.get(key)
+            if last is not None and last[0] is group:
+                codes.append(last[1])
+                continue
+            try:
+                code = generate(group)
+            except Exception as e:
+                self._on_error(key, e)
+                return False
+            output.codes[key] = (group, code)
+            codes.append(code)
+
+        parts = ([output.head] if output.head else []) + codes + \
+            ([output.tail] if output.tail else [])
+        if not write_if_changed(output.path, output.sep.join(parts)):
+            return False
+
+        if self._on_write is not None:
+            self._on_write(output.path)
+        return True
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        Poll until `stop` is set, or forever.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self._interval)
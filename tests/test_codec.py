@@ -0,0 +1,35 @@
+import pytest
+
+from fields_packer import Field, Block, compile_codec
+from fields_packer.codec import _RESERVED
+
+
+def make_block(name, names) -> Block:
+    block = Block(name, 0x10)
+    block.add_fields([
+        Field.new_field(name = n, addr = 0x10, bits = 4, shift = 4 * i)
+        for i, n in enumerate(names)])
+    return block
+
+
+def test_round_trip():
+    Codec = compile_codec(make_block("CTRL", ["mode", "div"]))
+    reg = Codec._decode(0x21)
+    assert (reg.mode, reg.div) == (1, 2)
+    reg.div = 3
+    assert reg._encode() == 0x31
+    assert Codec._pack(*Codec._unpack(0x45)) == 0x45
+
+
+@pytest.mark.parametrize("name", sorted(_RESERVED))
+def test_reserved_name(name):
+    block = make_block("RES_" + name, [name, "mode"])
+    with pytest.raises(ValueError, match = repr(name)):
+        compile_codec(block)
+
+    Codec = compile_codec(block, rename = True)
+    assert Codec._fields == ("_0", "mode")
+    reg = Codec(_0 = 1, mode = 2)
+    assert reg._encode() == 0x21
+    assert Codec._encode_many([reg]) == [0x21]
+    assert Codec._decode_many([0x21]) == [reg]
@@ -0,0 +1,51 @@
+import pytest
+
+from fields_packer import Field, Block, Group, DumpDecoder
+
+np = pytest.importorskip("numpy")
+
+
+def make_group() -> Group:
+    group = Group("dump")
+    ctrl = Block("CTRL", 0x10)
+    ctrl.add_fields([
+        Field.new_field(name = "en", addr = 0x10, bits = 1, shift = 0),
+        Field.new_field(name = "mode", addr = 0x10, bits = 3, shift = 1),
+        Field.new_field(name = "top", addr = 0x10, bits = 4, shift = 28),
+    ])
+    data = Block("DATA", 0x14)
+    data.add_fields([
+        Field.new_field(name = "word", addr = 0x14, bits = 32, shift = 0),
+    ])
+    group.add_block(ctrl)
+    group.add_block(data)
+    return group
+
+
+VALUES = [0xf000000b, 0x12345678, 0xffffffff, 0x00000005]
+
+
+@pytest.mark.parametrize("dtype", ["<u4", "<i4", ">i4"])
+def test_trace(dtype):
+    decoder = DumpDecoder(make_group())
+    addrs = np.array([0x10, 0x14, 0x14, 0x10], dtype = "<u4")
+    values = np.array(VALUES, dtype = "<u4").astype(dtype.replace("i", "u")) \
+        .view(dtype)
+
+    res = decoder.decode_trace((addrs, values))
+    assert res["CTRL"]["index"].tolist() == [0, 3]
+    assert res["CTRL"]["en"].tolist() == [1, 1]
+    assert res["CTRL"]["mode"].tolist() == [5, 2]
+    assert res["CTRL"]["top"].tolist() == [0xf, 0]
+    assert res["DATA"]["word"].tolist() == [0x12345678, 0xffffffff]
+
+
+@pytest.mark.parametrize("dtype", ["<u4", "<i4"])
+def test_image(dtype):
+    decoder = DumpDecoder(make_group())
+    image = np.array([0xf000000b, 0xffffffff], dtype = "<u4").view(dtype)
+
+    res = decoder.decode_image(image, base = 0x10)
+    assert int(res["CTRL"]["top"]) == 0xf
+    assert int(res["CTRL"]["mode"]) == 5
+    assert int(res["DATA"]["word"]) == 0xffffffff
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from fields_packer import Field, Block, Group, CGeneratorBase, CUnionBase
+
+
+def make_group(addrs) -> Group:
+    group = Group("Bus")
+    for i, addr in enumerate(addrs):
+        block = Block("REG{}".format(i), addr)
+        block.add_fields([Field.new_field(
+            name = "reg{}_f".format(i), addr = addr, bits = 8, shift = 0)])
+        group.add_block(block)
+    return group
+
+
+def test_bank_int_addr():
+    code = CGeneratorBase(make_group([0x10, 0x11]), burst = True).generate()
+    assert "bank_load_REG0" in code
+    assert "(uintptr_t)(16 + i * 1)" in code
+
+
+def test_bank_tuple_addr_needs_templates():
+    group = make_group([(1, 0x10), (1, 0x11)])
+    with pytest.raises(ValueError, match = "TEMPLETE_BURST"):
+        CGeneratorBase(group, burst = True).generate()
+
+    class PeripheralGenerator(CGeneratorBase):
+        TEMPLETE_BURST_READ = "\tpread_burst({raw[0]}, {raw[1]}, buf, {count});"
+        TEMPLETE_BURST_WRITE = "\tpwrite_burst({raw[0]}, {raw[1]}, buf, {count});"
+
+    code = PeripheralGenerator(group, burst = True).generate()
+    assert "pread_burst(1, 16, buf, 2);" in code
+
+
+def test_union_width_checked():
+    group = Group("Bus")
+    block = Block("WIDE", 0x10)
+    block.add_fields([Field.new_field(
+        name = "wide_f", addr = 0x10, bits = 4, shift = CUnionBase.MAX_BITS)])
+    group.add_block(block)
+    with pytest.raises(Block.FieldOverflow, match = "wide_f"):
+        CGeneratorBase(group).generate()
+
+
+def test_write_to_streams_generate_iter():
+    class Generator(CGeneratorBase):
+        def generate_iter(self):
+            yield "/* head */\n"
+            yield from super().generate_iter()
+
+    out = io.StringIO()
+    gen = Generator(make_group([0x10, 0x11]))
+    assert gen.write_to(out) == len(out.getvalue())
+    assert out.getvalue() == gen.generate()
+    assert out.getvalue().startswith("/* head */\n")
+
+
+def test_parallel_same_as_serial():
+    group = make_group(list(range(0x10, 0x30)))
+    serial = CGeneratorBase(group, burst = True).generate()
+    gen = CGeneratorBase(group, jobs = 2, chunksize = 3, burst = True)
+    gen.WINDOW = 1
+    assert gen.generate() == serial
+    # unions are only created in the workers
+    assert gen._CGeneratorBase__unions is None
+    assert len(gen._unions) == len(group.dump())
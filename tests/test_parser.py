@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from fields_packer import CsvBulkParser
+
+CSV = "\n".join([
+    ",# addr=0x10, CTRL",
+    ",[3:0],ctrl_mode",
+    "",
+])
+
+
+def test_failed_parse_isnt_parsed(tmp_path):
+    parser = CsvBulkParser(str(tmp_path / "missing.csv"), "Bus")
+    for _ in range(2):
+        with pytest.raises(FileNotFoundError):
+            parser.gen_group()
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(parser.gen_group_async())
+    assert not parser._is_parsed
+
+    (tmp_path / "missing.csv").write_text(CSV)
+    group = asyncio.run(parser.gen_group_async())
+    assert [f.name for f in group.dump()[0].dump()] == ["ctrl_mode"]
+    assert parser.gen_group() is group
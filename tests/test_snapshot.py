@@ -0,0 +1,92 @@
+import pytest
+
+from fields_packer import Field, Block, Group, FieldTable, SourceRef
+from fields_packer import CsvBulkParser, save_group, load_group
+
+CSV = "\n".join([
+    "# c",
+    ",# addr=(0x01 0x0010), DEV_CTRL",
+    ",[3:0],dev_mode",
+    ",[4],dev_en",
+    ",# addr=0x20, CTRL",
+    ",[7:0],ctrl_div",
+    "",
+])
+
+BIG = 1 << 80
+
+
+def any_addr(block, field):
+    return True
+
+
+def build(path) -> Group:
+    """
+    The group mixes what snapshot stores in different columns: SourceRefs and
+    None sources in one group, int and tuple addresses, values beyond 64 bits,
+    and sparse fields.
+    """
+    group = CsvBulkParser(path, "mixed", source = True).gen_group()
+
+    # sources of these fields are None, so f_source is omitted.
+    addr = (2, BIG)
+    block = Block("HAND", addr, checker = any_addr)
+    block.add_fields([
+        Field.new_field(name = "hand_none", addr = addr, bits = 4, shift = 0),
+        Field.new_field(name = "hand_big", addr = addr, bits = 8, shift = 4,
+                        default = BIG - 1, extra = BIG),
+        Field.new_field(name = "hand_other", addr = (2, 0), bits = 4,
+                        shift = 12, group = "g", default = -1, source = "s"),
+    ])
+    block.reverse = True
+    group.add_block(block)
+    group.add_block(Block("EMPTY", "no fields"))
+    return group
+
+
+def describe(group):
+    """
+    Comparable contents of the group, SourceRefs are compared by location
+    and text because loaded ones refer to new SourceFiles. Blocks are in
+    insertion order, int and tuple addresses can't be sorted together.
+    """
+    def source(s):
+        if type(s) is SourceRef:
+            return ("ref", s.location(), s.text())
+        return s
+
+    return [(b.name(), b._addr, b.reverse,
+             [tuple(f)[:-2] + (source(f.source), f.extra) for f in b.dump()])
+            for b in group._blocks]
+
+
+@pytest.mark.parametrize("table", [False, True])
+def test_round_trip(tmp_path, table):
+    path = tmp_path / "m.csv"
+    path.write_text(CSV)
+    group = build(str(path))
+    snap = str(tmp_path / "m.fpsnap")
+    save_group(group, snap)
+
+    loaded = load_group(snap, table = FieldTable() if table else None)
+    assert loaded.name() == group.name()
+    assert describe(loaded) == describe(group)
+    if table:
+        assert all(type(f).__name__ == "FieldView"
+                   for b in loaded._blocks for f in b._fields)
+
+
+def test_empty(tmp_path):
+    snap = str(tmp_path / "e.fpsnap")
+    save_group(Group("empty"), snap)
+    assert load_group(snap)._blocks == []
+
+
+def test_bcreator_checks_width(tmp_path):
+    path = tmp_path / "m.csv"
+    path.write_text(CSV)
+    snap = str(tmp_path / "m.fpsnap")
+    save_group(CsvBulkParser(str(path)).gen_group(), snap)
+
+    with pytest.raises(Block.FieldOverflow):
+        load_group(snap, bcreator = Block.BlockCreator(max_bits = 4))
@@ -0,0 +1,40 @@
+import pickle
+
+from fields_packer import Field, FieldTable, FieldView
+
+
+def make_field(**kw) -> Field:
+    args = dict(name = "ctrl_mode", addr = (1, 0x10), bits = 4, shift = 4)
+    args.update(kw)
+    return Field.new_field(**args)
+
+
+def test_columns_have_explicit_widths():
+    table = FieldTable()
+    assert table._name_end.typecode == "Q"
+    assert table._addr_col.typecode == "I"
+
+
+def test_view_as_field():
+    field = make_field(default = 3, extra = "x")
+    table = FieldTable()
+    view = table.append(field)
+
+    assert view == field and field == view
+    assert view != make_field(shift = 8)
+    assert view == table.append(field)
+    assert hash(view) == hash(field)
+    assert len(view) == len(field)
+    assert view[0] == "ctrl_mode" and view[-1] == "x"
+    assert view[2:4] == field[2:4]
+    name, addr, *_ = view
+    assert (name, addr) == ("ctrl_mode", (1, 0x10))
+
+    assert view._asdict() == field._asdict()
+    assert view._fields == Field._fields
+    replaced = view._replace(name = "ctrl_div")
+    assert type(replaced) is Field and replaced.name == "ctrl_div"
+    assert view.name == "ctrl_mode"
+
+    assert pickle.loads(pickle.dumps(view)) == field
+    assert not isinstance(view, tuple) and type(view) is FieldView